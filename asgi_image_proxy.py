@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+⚡ PROXY DE IMAGENS ASSÍNCRONO (ASGI)
+✅ Mesmas rotas /proxy-image e /api/image-proxy do servidor Flask
+✅ Pool de conexões httpx e limite de concorrência por host
+✅ Streaming da imagem sem prender um worker por requisição
+✅ Demais rotas continuam no app Flask (via a2wsgi)
+
+Uso: uvicorn asgi_image_proxy:app --host 0.0.0.0 --port 5007
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+import httpx
+from a2wsgi import WSGIMiddleware
+
+from json_landing_generator import (
+    app as flask_app, is_allowed_image_url, IMAGE_PROXY_HEADERS,
+    UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUT,
+    UpstreamUnavailable, check_upstream, record_upstream_status, circuit_breaker,
+    check_rate_limits, generator, THUMBNAIL_WIDTHS
+)
+
+logger = logging.getLogger(__name__)
+
+PROXY_PATHS = ('/proxy-image', '/api/image-proxy')
+
+# Limites configuráveis por variável de ambiente
+MAX_CONNECTIONS = int(os.getenv('PROXY_MAX_CONNECTIONS', '1000'))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('PROXY_MAX_KEEPALIVE', '200'))
+PER_HOST_LIMIT = int(os.getenv('PROXY_PER_HOST_LIMIT', '256'))
+PER_HOST_QUEUE = int(os.getenv('PROXY_PER_HOST_QUEUE', '2048'))
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Imagens já vêm comprimidas: pedir sem content-encoding permite repassar os bytes crus
+ASYNC_PROXY_HEADERS = {**IMAGE_PROXY_HEADERS, 'Accept-Encoding': 'identity'}
+
+CORS_HEADERS = [
+    (b'access-control-allow-origin', b'*'),
+    (b'access-control-allow-methods', b'GET'),
+]
+
+
+class AsyncImageProxy:
+    def __init__(self):
+        self.client: Optional[httpx.AsyncClient] = None
+        self.host_limits: Dict[str, asyncio.Semaphore] = {}
+        self.host_waiting: Dict[str, int] = {}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Criar (uma única vez) o cliente HTTP com pool de conexões"""
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS
+                ),
+                timeout=httpx.Timeout(UPSTREAM_READ_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT),
+                follow_redirects=True
+            )
+        return self.client
+
+    def _host_semaphore(self, host: str) -> asyncio.Semaphore:
+        """Semáforo por host: excesso de requisições espera na fila em vez de abrir mais conexões"""
+        semaphore = self.host_limits.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(PER_HOST_LIMIT)
+            self.host_limits[host] = semaphore
+        return semaphore
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def handle(self, scope, receive, send):
+        """Proxy para servir imagens da Shopee contornando CORS"""
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        image_url = query.get('url', [None])[0]
+        if not image_url:
+            await _send_json(send, 400, {"error": "URL da imagem não fornecida"})
+            return
+
+        if not is_allowed_image_url(image_url):
+            await _send_json(send, 403, {"error": "URL não permitida"})
+            return
+
+        request_headers = dict(scope.get('headers', []))
+        client_ip = (scope.get('client') or ('unknown', 0))[0]
+        api_key = request_headers.get(b'x-api-key', b'').decode('latin-1') or None
+        wait = check_rate_limits('proxy', client_ip, api_key)
+        if wait:
+            await _send_json(send, 429, {"error": "Muitas requisições, tente novamente em instantes"},
+                             [(b'retry-after', str(max(1, math.ceil(wait))).encode('latin-1'))])
+            return
+
+        # Largura de miniatura opcional (?w=300)
+        width = query.get('w', [None])[0]
+        if width is not None:
+            width = int(width) if width.isdigit() else -1
+            if width not in THUMBNAIL_WIDTHS:
+                await _send_json(send, 400, {"error": f"Largura inválida, use uma de {list(THUMBNAIL_WIDTHS)}"})
+                return
+
+        # Servir do cache quando disponível (aquecido no upload ou em visita anterior); disco sempre fora do loop
+        cache = generator.image_cache
+        cached = ((await asyncio.to_thread(cache.thumbnail, image_url, width) if width else None)
+                  or await asyncio.to_thread(cache.get, image_url))
+        if cached:
+            await _send_cached(send, scope, *cached)
+            return
+
+        host = urlparse(image_url).hostname or ''
+        client = self._get_client()
+        semaphore = self._host_semaphore(host)
+
+        # Fila por host limitada: acima disso descarta rápido em vez de acumular
+        if semaphore.locked() and self.host_waiting.get(host, 0) >= PER_HOST_QUEUE:
+            await _send_json(send, 503, {"error": "Servidor sobrecarregado, tente novamente em instantes"},
+                             [(b'retry-after', b'1')])
+            return
+
+        self.host_waiting[host] = self.host_waiting.get(host, 0) + 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.host_waiting[host] -= 1
+
+        try:
+            # Checado já com a vaga na fila: o circuito pode ter aberto enquanto esperava
+            try:
+                check_upstream(image_url)
+            except UpstreamUnavailable as e:
+                extra = [(b'retry-after', str(int(e.retry_after) + 1).encode('latin-1'))] if e.retry_after else []
+                await _send_json(send, e.status_code, {"error": str(e)}, extra)
+                return
+
+            try:
+                upstream_request = client.build_request('GET', image_url, headers=ASYNC_PROXY_HEADERS)
+                response = await client.send(upstream_request, stream=True)
+            except httpx.InvalidURL as e:
+                circuit_breaker.release_probe(host)
+                await _send_json(send, 400, {"error": f"URL inválida: {str(e)}"})
+                return
+            except httpx.TimeoutException:
+                circuit_breaker.record_failure(host)
+                logger.warning(f"⏰ Timeout ao buscar imagem: {image_url[:50]}...")
+                await _send_json(send, 408, {"error": "Timeout ao buscar imagem"})
+                return
+            except httpx.HTTPError as e:
+                circuit_breaker.record_failure(host)
+                logger.warning(f"❌ Erro de rede: {e}")
+                await _send_json(send, 500, {"error": f"Erro de rede: {str(e)}"})
+                return
+            except BaseException:
+                # Cliente desconectou ou erro local: não conta como falha do upstream,
+                # mas a sonda meio-aberta precisa ser liberada
+                circuit_breaker.release_probe(host)
+                raise
+
+            record_upstream_status(image_url, host, response.status_code)
+            try:
+                if response.status_code != 200:
+                    logger.warning(f"❌ Erro ao buscar imagem: HTTP {response.status_code}")
+                    await _send_json(send, response.status_code,
+                                     {"error": f"Erro ao buscar imagem: HTTP {response.status_code}"})
+                    return
+
+                # Miniatura: baixar o original inteiro para o cache e redimensionar fora do loop
+                if width:
+                    async with _CacheWriter(cache, image_url) as writer:
+                        async for chunk in response.aiter_raw(STREAM_CHUNK_SIZE):
+                            await writer.write(chunk)
+                        await writer.commit()
+                    cached = (await asyncio.to_thread(cache.thumbnail, image_url, width)
+                              or await asyncio.to_thread(cache.get, image_url))
+                    await _send_cached(send, scope, *cached)
+                    return
+
+                headers = [
+                    (b'content-type', response.headers.get('content-type', 'image/jpeg').encode('latin-1')),
+                    (b'cache-control', b'public, max-age=3600'),  # Cache por 1 hora
+                ] + CORS_HEADERS
+                content_length = response.headers.get('content-length')
+                if content_length and 'content-encoding' not in response.headers:
+                    headers.append((b'content-length', content_length.encode('latin-1')))
+
+                await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+                if scope['method'] != 'HEAD':
+                    # Repassar ao cliente e gravar no cache ao mesmo tempo
+                    async with _CacheWriter(cache, image_url) as writer:
+                        async for chunk in response.aiter_raw(STREAM_CHUNK_SIZE):
+                            await asyncio.gather(
+                                writer.write(chunk),
+                                send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                            )
+                        await writer.commit()
+                await send({'type': 'http.response.body', 'body': b''})
+
+            except httpx.HTTPError as e:
+                # Cabeçalhos já enviados: só resta encerrar a conexão
+                logger.warning(f"❌ Erro durante streaming da imagem: {e}")
+                raise
+            finally:
+                await response.aclose()
+        finally:
+            semaphore.release()
+
+
+class _CacheWriter:
+    """Grava a imagem no cache em threads (abrir, escrever, publicar, descartar), sem bloquear o loop"""
+    def __init__(self, cache, url: str):
+        self.cache = cache
+        self.url = url
+        self.tmp_path = cache.temp_path_for(url)
+        self.file = None
+    
+    async def __aenter__(self):
+        self.file = await asyncio.to_thread(open, self.tmp_path, 'wb')
+        return self
+    
+    async def write(self, chunk: bytes):
+        await asyncio.to_thread(self.file.write, chunk)
+    
+    async def commit(self):
+        await asyncio.to_thread(self._close_and_commit)
+    
+    def _close_and_commit(self):
+        self.file.close()
+        self.cache.commit(self.tmp_path, self.url)
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        # Sem commit (erro ou cliente desconectado): descartar o temporário
+        await asyncio.to_thread(self._discard)
+    
+    def _discard(self):
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+async def _send_json(send, status: int, payload: Dict, extra_headers: Optional[List[Tuple[bytes, bytes]]] = None):
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    headers: List[Tuple[bytes, bytes]] = [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(body)).encode('latin-1')),
+    ] + CORS_HEADERS + (extra_headers or [])
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _send_cached(send, scope, path: str, content_type: str):
+    body = await asyncio.to_thread(_read_file, path)
+    headers = [
+        (b'content-type', content_type.encode('latin-1')),
+        (b'content-length', str(len(body)).encode('latin-1')),
+        (b'cache-control', b'public, max-age=3600'),  # Cache por 1 hora
+    ] + CORS_HEADERS
+    await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body if scope['method'] != 'HEAD' else b''})
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await proxy.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+# Instâncias globais
+proxy = AsyncImageProxy()
+wsgi_app = WSGIMiddleware(flask_app)
+
+async def app(scope, receive, send):
+    """Roteador ASGI: proxy de imagens assíncrono, demais rotas no Flask"""
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+
+    if scope['type'] == 'http' and scope['path'] in PROXY_PATHS and scope['method'] in ('GET', 'HEAD'):
+        await proxy.handle(scope, receive, send)
+        return
+
+    await wsgi_app(scope, receive, send)
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print("⚡ PROXY DE IMAGENS ASSÍNCRONO (ASGI)")
+    print("=" * 50)
+    print(f"✅ Conexões máximas: {MAX_CONNECTIONS}")
+    print(f"✅ Limite por host: {PER_HOST_LIMIT}")
+    print("📡 Servidor: http://localhost:5007")
+    print("🔗 Rotas assíncronas: /proxy-image, /api/image-proxy")
+    print("🔗 Demais rotas: app Flask")
+    print("=" * 50)
+
+    uvicorn.run(app, host='0.0.0.0', port=5007, backlog=4096)
@@ -7,17 +7,40 @@
 ✅ Processamento de imagens e dados estruturados
 """
 
-from flask import Flask, request, jsonify, render_template_string, Response
+from flask import Flask, request, jsonify, render_template_string, Response, send_file
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 import json
 import base64
+import binascii
+import bisect
+import codecs
+import hashlib
+import heapq
+import io
 import os
+import re
+import string
+import struct
 import time
 import logging
-from typing import Dict, List, Optional, Any
+import math
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from itertools import accumulate, repeat
+from typing import Dict, List, Optional, Any, Tuple, Iterator, Callable
 import requests
-from urllib.parse import urlparse
+from urllib.parse import urlparse, urlsplit, parse_qs
 import uuid
+from array import array
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow é opcional: sem ele o proxy não gera miniaturas
+    Image = None
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -25,16 +48,1717 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)
 
+# 🖼️ Configuração compartilhada do proxy de imagens (Flask e ASGI)
+IMAGE_PROXY_ALLOWED_HOSTS = ('susercontent.com', 'shopee.com')
+
+# Headers para simular navegador real
+IMAGE_PROXY_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
+    'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Referer': 'https://shopee.com.br/',
+    'Sec-Fetch-Dest': 'image',
+    'Sec-Fetch-Mode': 'no-cors',
+    'Sec-Fetch-Site': 'cross-site'
+}
+
+def is_allowed_image_url(image_url: str) -> bool:
+    """Verificar se é uma URL da Shopee válida para o proxy"""
+    return any(host in image_url for host in IMAGE_PROXY_ALLOWED_HOSTS)
+
+# ⏱️ Prazos do upstream: conexão e leitura separados
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', '3'))
+UPSTREAM_READ_TIMEOUT = float(os.getenv('UPSTREAM_READ_TIMEOUT', '10'))
+UPSTREAM_TIMEOUT = (UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUT)
+# O timeout de leitura vale por leitura de socket; este é o prazo total da requisição
+UPSTREAM_TOTAL_TIMEOUT = float(os.getenv('UPSTREAM_TOTAL_TIMEOUT', '15'))
+UPSTREAM_CHUNK_SIZE = 8 * 1024  # blocos pequenos: o prazo total é checado a cada bloco
+
+# Erros do próprio pedido (URL malformada), não do host: não contam no circuit breaker
+UPSTREAM_CLIENT_ERRORS = (
+    requests.exceptions.InvalidURL,
+    requests.exceptions.MissingSchema,
+    requests.exceptions.InvalidSchema,
+    requests.exceptions.URLRequired
+)
+
+# Status que indicam problema na URL (não no host) e vão para o cache negativo
+NEGATIVE_CACHE_STATUSES = (400, 403, 404, 410)
+
+class UpstreamUnavailable(Exception):
+    """Upstream recusado sem fazer requisição (circuito aberto ou cache negativo)"""
+    def __init__(self, message: str, status_code: int = 503, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """Circuit breaker por host: falha rápido enquanto o upstream está degradado"""
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, max_reset_timeout: float = 300.0,
+                 probe_lease: float = UPSTREAM_TOTAL_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        # Sonda sem resultado após este prazo (travada ou perdida) é descartada e outra é liberada
+        self.probe_lease = probe_lease
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, Dict] = {}
+    
+    def _get_state(self, host: str) -> Dict:
+        state = self._hosts.get(host)
+        if state is None:
+            state = {'state': 'closed', 'failures': 0, 'opened_at': 0.0, 'open_timeout': self.reset_timeout, 'probe_started': 0.0}
+            self._hosts[host] = state
+        return state
+    
+    def allow_request(self, host: str) -> bool:
+        """Verificar se uma requisição pode ir ao host (meio-aberto libera uma única sonda)"""
+        with self._lock:
+            state = self._get_state(host)
+            if state['state'] == 'closed':
+                return True
+            if state['state'] == 'open':
+                if time.time() - state['opened_at'] < state['open_timeout']:
+                    return False
+                state['state'] = 'half_open'
+                state['probe_started'] = 0.0
+            # Meio-aberto: apenas uma sonda por vez, o resto falha rápido
+            now = time.time()
+            if state['probe_started'] and now - state['probe_started'] < self.probe_lease:
+                return False
+            state['probe_started'] = now
+            return True
+    
+    def record_success(self, host: str):
+        with self._lock:
+            state = self._get_state(host)
+            if state['state'] != 'closed':
+                logger.info(f"✅ Circuito fechado para {host}")
+            state.update({'state': 'closed', 'failures': 0, 'open_timeout': self.reset_timeout, 'probe_started': 0.0})
+    
+    def record_failure(self, host: str):
+        with self._lock:
+            state = self._get_state(host)
+            state['failures'] += 1
+            if state['state'] == 'half_open':
+                # Sonda falhou: reabrir com espera maior (backoff exponencial)
+                state['open_timeout'] = min(state['open_timeout'] * 2, self.max_reset_timeout)
+            elif state['state'] == 'open' or state['failures'] < self.failure_threshold:
+                return
+            state.update({'state': 'open', 'opened_at': time.time(), 'probe_started': 0.0})
+            logger.warning(f"⚠️ Circuito aberto para {host} por {state['open_timeout']:.0f}s")
+    
+    def release_probe(self, host: str):
+        """Liberar a sonda meio-aberta sem registrar resultado (requisição cancelada)"""
+        with self._lock:
+            self._get_state(host)['probe_started'] = 0.0
+    
+    def retry_after(self, host: str) -> float:
+        """Segundos até a próxima sonda ser liberada"""
+        with self._lock:
+            state = self._get_state(host)
+            if state['state'] == 'half_open' and state['probe_started']:
+                # Sonda em andamento: no máximo até o fim do prazo dela
+                return max(1.0, state['probe_started'] + self.probe_lease - time.time())
+            if state['state'] != 'open':
+                return 0.0
+            return max(0.0, state['opened_at'] + state['open_timeout'] - time.time())
+    
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {host: {'state': s['state'], 'failures': s['failures']} for host, s in self._hosts.items()}
+
+class NegativeCache:
+    """Cache de curta duração para URLs que falharam recentemente"""
+    def __init__(self, ttl: float = 60.0, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+    
+    def add(self, url: str, status_code: int):
+        with self._lock:
+            self._entries.pop(url, None)
+            self._entries[url] = (time.time() + self.ttl, status_code)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def get(self, url: str) -> Optional[tuple]:
+        """Retorna (status, segundos restantes) se a URL ainda estiver no cache"""
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return None
+            expires_at, status_code = entry
+            remaining = expires_at - time.time()
+            if remaining <= 0:
+                del self._entries[url]
+                return None
+            return status_code, remaining
+
+circuit_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv('UPSTREAM_FAILURE_THRESHOLD', '5')),
+    reset_timeout=float(os.getenv('UPSTREAM_RESET_TIMEOUT', '30'))
+)
+negative_cache = NegativeCache(ttl=float(os.getenv('UPSTREAM_NEGATIVE_TTL', '60')))
+
+def check_upstream(url: str) -> str:
+    """Falhar rápido pelo cache negativo ou circuito aberto; retorna o host liberado"""
+    cached = negative_cache.get(url)
+    if cached:
+        status_code, remaining = cached
+        raise UpstreamUnavailable(f"Erro ao buscar imagem: HTTP {status_code} (cache)", status_code, remaining)
+    
+    host = urlparse(url).hostname or ''
+    if not circuit_breaker.allow_request(host):
+        raise UpstreamUnavailable(f"Upstream indisponível: {host}", 503, circuit_breaker.retry_after(host))
+    return host
+
+def record_upstream_status(url: str, host: str, status_code: int):
+    """Registrar resultado HTTP no circuit breaker e no cache negativo"""
+    if status_code >= 500 or status_code == 429:
+        circuit_breaker.record_failure(host)
+    else:
+        circuit_breaker.record_success(host)
+    if status_code in NEGATIVE_CACHE_STATUSES:
+        negative_cache.add(url, status_code)
+
+def _read_with_deadline(response: requests.Response, deadline: float) -> bytes:
+    """Ler o corpo em blocos, abortando se o prazo total acabar (upstream 'gotejando')"""
+    chunks = []
+    for chunk in response.iter_content(UPSTREAM_CHUNK_SIZE):
+        chunks.append(chunk)
+        if time.monotonic() > deadline:
+            response.close()
+            raise requests.exceptions.Timeout(f"Prazo total de {UPSTREAM_TOTAL_TIMEOUT}s excedido")
+    return b''.join(chunks)
+
+def fetch_upstream(url: str, headers: Optional[Dict] = None) -> requests.Response:
+    """GET no upstream com circuit breaker por host, cache negativo e prazos de conexão, leitura e total"""
+    host = check_upstream(url)
+    deadline = time.monotonic() + UPSTREAM_TOTAL_TIMEOUT
+    try:
+        response = requests.get(url, headers=headers, timeout=UPSTREAM_TIMEOUT, stream=True)
+        response._content = _read_with_deadline(response, deadline)
+    except UPSTREAM_CLIENT_ERRORS:
+        circuit_breaker.release_probe(host)
+        raise
+    except requests.exceptions.RequestException:
+        circuit_breaker.record_failure(host)
+        raise
+    except BaseException:
+        # Interrupção local (ex.: KeyboardInterrupt): não é falha do host
+        circuit_breaker.release_probe(host)
+        raise
+    record_upstream_status(url, host, response.status_code)
+    return response
+
+# 🚦 Controle de admissão: limites de concorrência e taxa por rota
+class ConcurrencyLimiter:
+    """Limite de requisições simultâneas com fila de espera limitada"""
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._condition = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+    
+    def acquire(self) -> bool:
+        """Ocupar uma vaga; False se a fila estiver cheia ou o prazo de espera acabar"""
+        with self._condition:
+            if self._active < self.max_concurrent:
+                self._active += 1
+                return True
+            if self._waiting >= self.max_queue:
+                return False
+            
+            self._waiting += 1
+            try:
+                deadline = time.monotonic() + self.queue_timeout
+                while self._active >= self.max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._condition.wait(remaining)
+                self._active += 1
+                return True
+            finally:
+                self._waiting -= 1
+    
+    def release(self):
+        with self._condition:
+            self._active -= 1
+            self._condition.notify()
+    
+    def snapshot(self) -> Dict:
+        with self._condition:
+            return {'active': self._active, 'waiting': self._waiting, 'max_concurrent': self.max_concurrent}
+
+class RateLimiter:
+    """Token bucket por chave (IP do cliente ou API key)"""
+    def __init__(self, rate: float, burst: float, max_keys: int = 100000,
+                 lock: Optional[threading.Lock] = None):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # Lock compartilhável: permite checar vários buckets antes de consumir de qualquer um
+        self.lock = lock or threading.Lock()
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+    
+    def _refill(self, key: str, now: float) -> List[float]:
+        """Repor tokens do bucket (chamar com o lock adquirido)"""
+        bucket = self._buckets.pop(key, None)
+        if bucket is None:
+            bucket = [self.burst, now]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        self._buckets[key] = bucket
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return bucket
+    
+    def wait_time(self, key: str, now: float) -> float:
+        """Segundos até haver um token, sem consumir (chamar com o lock adquirido)"""
+        bucket = self._refill(key, now)
+        return 0.0 if bucket[0] >= 1 else (1 - bucket[0]) / self.rate
+    
+    def consume(self, key: str):
+        """Gastar um token já verificado por wait_time (chamar com o lock adquirido)"""
+        self._buckets[key][0] -= 1
+    
+    def acquire(self, key: str) -> float:
+        """Consumir um token; retorna 0 se liberado ou os segundos até o próximo token"""
+        with self.lock:
+            wait = self.wait_time(key, time.monotonic())
+            if not wait:
+                self.consume(key)
+            return wait
+
+def _build_route_limits(name: str, concurrency: int, queue: int, queue_timeout: float, rate: float, burst: float) -> Dict:
+    prefix = f"ADMISSION_{name.upper()}"
+    rate = float(os.getenv(f'{prefix}_RATE', str(rate)))
+    burst = float(os.getenv(f'{prefix}_BURST', str(burst)))
+    if rate <= 0 or burst < 1:
+        raise ValueError(f"{prefix}_RATE deve ser > 0 e {prefix}_BURST >= 1 (recebido {rate}, {burst})")
+    lock = threading.Lock()
+    return {
+        'concurrency': ConcurrencyLimiter(
+            name,
+            int(os.getenv(f'{prefix}_CONCURRENCY', str(concurrency))),
+            int(os.getenv(f'{prefix}_QUEUE', str(queue))),
+            float(os.getenv(f'{prefix}_QUEUE_TIMEOUT', str(queue_timeout)))
+        ),
+        'ip': RateLimiter(rate, burst, lock=lock),
+        'api_key': RateLimiter(rate, burst, lock=lock)
+    }
+
+# Pools separados: upload e proxy não disputam vagas entre si nem com /landing/<id>
+ROUTE_LIMITS = {
+    'proxy': _build_route_limits('proxy', concurrency=64, queue=128, queue_timeout=2.0, rate=50, burst=200),
+    'upload': _build_route_limits('upload', concurrency=4, queue=8, queue_timeout=5.0, rate=2, burst=20)
+}
+
+def check_rate_limits(pool: str, client_ip: str, api_key: Optional[str]) -> float:
+    """Aplicar token bucket por IP e por API key; retorna segundos de espera (0 se liberado)"""
+    limits = ROUTE_LIMITS[pool]
+    checks = [(limits['ip'], client_ip or 'unknown')]
+    if api_key:
+        checks.append((limits['api_key'], api_key))
+    
+    # Checar todos os buckets antes de consumir: uma recusa não gasta token de nenhum deles
+    with limits['ip'].lock:
+        now = time.monotonic()
+        wait = max(limiter.wait_time(key, now) for limiter, key in checks)
+        if not wait:
+            for limiter, key in checks:
+                limiter.consume(key)
+    return wait
+
+def _overload_response(status_code: int, message: str, retry_after: float):
+    return jsonify({"error": message}), status_code, {'Retry-After': str(max(1, math.ceil(retry_after)))}
+
+def admission_control(pool: str):
+    """Decorator de rota: 429 se exceder a taxa, 503 se o pool estiver saturado"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            wait = check_rate_limits(pool, request.remote_addr, request.headers.get('X-API-Key'))
+            if wait:
+                return _overload_response(429, "Muitas requisições, tente novamente em instantes", wait)
+            
+            limiter = ROUTE_LIMITS[pool]['concurrency']
+            if not limiter.acquire():
+                logger.warning(f"⚠️ Pool '{pool}' saturado, requisição descartada")
+                return _overload_response(503, "Servidor sobrecarregado, tente novamente em instantes", limiter.queue_timeout)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                limiter.release()
+        return wrapper
+    return decorator
+
+# 🔎 Busca textual: índice invertido incremental
+SEARCH_STOPWORDS = {
+    'a', 'o', 'as', 'os', 'e', 'de', 'da', 'do', 'das', 'dos', 'em', 'no', 'na', 'nos', 'nas',
+    'um', 'uma', 'para', 'por', 'com', 'sem', 'ao', 'aos', 'que', 'se', 'ou'
+}
+
+# Peso de cada campo no cálculo de relevância
+SEARCH_FIELD_WEIGHTS = {'name': 3.0, 'specifications': 1.5, 'description': 1.0, 'comments': 0.5}
+
+def normalize_search_text(text: Any) -> str:
+    """Remover acentos (pt-BR) e converter para minúsculas"""
+    decomposed = unicodedata.normalize('NFKD', str(text))
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+def tokenize_search_text(text: Any) -> List[str]:
+    return [t for t in re.findall(r'[a-z0-9]+', normalize_search_text(text)) if len(t) > 1 and t not in SEARCH_STOPWORDS]
+
+def parse_price_value(value: Any) -> Optional[float]:
+    """Extrair valor numérico de um preço formatado ("R$ 129.90")"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    numbers = re.findall(r'[\d,\.]+', str(value or ''))
+    if numbers:
+        try:
+            return float(numbers[0].replace(',', '.'))
+        except ValueError:
+            return None
+    return None
+
+class ProductSearchIndex:
+    """Índice invertido persistido em snapshot + log append-only.
+    
+    O snapshot (gravado na compactação) guarda as postings por termo, com ids como deltas de
+    posição, e é carregado sem reconstruir termo a termo. O log guarda as atualizações posteriores,
+    uma por linha: [id, comprimento, meta, "termo peso termo peso ..."] ou [id, null] para remoção.
+    """
+    K1 = 1.2
+    B = 0.75
+    # Prefixos muito curtos: mantém só os termos mais frequentes e sinaliza truncated na resposta
+    MAX_PREFIX_EXPANSIONS = 50
+    # Até este custo (postings visitadas) todos são pontuados; acima, parada antecipada pela ordem de
+    # impacto, desde que os candidatos sejam boa parte das postings lidas (filtros e interseções esparsas não)
+    EXHAUSTIVE_SCORING_LIMIT = 40000
+    MAX_POSTINGS_PER_CANDIDATE = 8
+    # Teto de documentos pontuados na parada antecipada: ao atingir, o ranking é aproximado (truncated)
+    MAX_SCORED_CANDIDATES = 500
+    MAX_IMPACT_READS = 5000
+    IMPACT_BATCH_SIZE = 256
+    
+    def __init__(self, index_path: str):
+        self.index_path = index_path
+        self.snapshot_path = f"{os.path.splitext(index_path)[0]}.snapshot"
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._sorted_terms: List[str] = []
+        # Termos por documento só dos indexados após o snapshot (os demais são achados nas postings)
+        self._doc_terms: Dict[str, Dict[str, float]] = {}
+        # Ordem de impacto dos termos já buscados: peso -> [(comprimento, id)] em ordem crescente
+        self._impacts: Dict[str, Dict[float, List[Tuple[float, str]]]] = {}
+        self._doc_lengths: Dict[str, float] = {}
+        self._doc_meta: Dict[str, Dict] = {}
+        self._total_length = 0.0
+        self._log_entries = 0
+    
+    def __len__(self) -> int:
+        return len(self._doc_lengths)
+    
+    def __contains__(self, product_id: str) -> bool:
+        return product_id in self._doc_lengths
+    
+    def product_ids(self) -> List[str]:
+        with self._lock:
+            return list(self._doc_lengths)
+    
+    @staticmethod
+    def build_document(data: Dict, comments: Optional[List[Dict]] = None) -> Dict:
+        """Extrair termos ponderados e metadados de filtro de um produto.
+        
+        comments: todos os comentários do produto (o JSON salvo guarda só os primeiros).
+        """
+        specifications = data.get('specifications') or {}
+        if isinstance(specifications, dict):
+            spec_text = ' '.join(f"{k} {v}" for k, v in specifications.items())
+        else:
+            spec_text = ' '.join(str(s) for s in specifications)
+        if comments is None:
+            comments = data.get('comments') or []
+        comment_text = ' '.join(c.get('comment', '') for c in comments if isinstance(c, dict))
+        
+        fields = {
+            'name': data.get('name', ''),
+            'specifications': spec_text,
+            'description': data.get('description', ''),
+            'comments': comment_text
+        }
+        terms: Dict[str, float] = {}
+        length = 0.0
+        for field, text in fields.items():
+            weight = SEARCH_FIELD_WEIGHTS[field]
+            for token in tokenize_search_text(text):
+                terms[token] = terms.get(token, 0.0) + weight
+                length += weight
+        
+        meta = {
+            'name': data.get('name', ''),
+            'price': data.get('price', ''),
+            'price_value': parse_price_value(data.get('price')),
+            'rating': float(data.get('rating') or 0),
+            'category': data.get('category', ''),
+            'timestamp': data.get('timestamp', 0)
+        }
+        return {'terms': terms, 'length': length, 'meta': meta}
+    
+    def _apply(self, product_id: str, document: Optional[Dict]):
+        """Aplicar (ou remover, se document for None) um documento nas estruturas em memória"""
+        if product_id in self._doc_lengths:
+            old_terms = self._doc_terms.pop(product_id, None)
+            if old_terms is None:
+                old_terms = [term for term, postings in self._postings.items() if product_id in postings]
+            for term in old_terms:
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                weight = postings.pop(product_id, None)
+                impacts = self._impacts.get(term)
+                if impacts is not None and weight is not None:
+                    bucket = impacts[weight]
+                    del bucket[bisect.bisect_left(bucket, (self._doc_lengths[product_id], product_id))]
+                    if not bucket:
+                        del impacts[weight]
+                if not postings:
+                    del self._postings[term]
+                    self._impacts.pop(term, None)
+                    if self._sorted_terms is None:
+                        continue
+                    position = bisect.bisect_left(self._sorted_terms, term)
+                    if position < len(self._sorted_terms) and self._sorted_terms[position] == term:
+                        del self._sorted_terms[position]
+            self._total_length -= self._doc_lengths.pop(product_id, 0.0)
+            self._doc_meta.pop(product_id, None)
+        
+        if document is None:
+            return
+        
+        for term, weight in document['terms'].items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                if self._sorted_terms is not None:
+                    bisect.insort(self._sorted_terms, term)
+            postings[product_id] = weight
+            impacts = self._impacts.get(term)
+            if impacts is not None:
+                bisect.insort(impacts.setdefault(weight, []), (document['length'], product_id))
+        self._doc_terms[product_id] = document['terms']
+        self._doc_lengths[product_id] = document['length']
+        self._doc_meta[product_id] = document['meta']
+        self._total_length += document['length']
+    
+    @staticmethod
+    def _encode_entry(product_id: str, document: Optional[Dict]) -> str:
+        """Linha compacta do log: termos numa única string (bem mais rápida de decodificar que um objeto)"""
+        if document is None:
+            return json.dumps([product_id, None]) + '\n'
+        terms = ' '.join(f"{term} {weight:g}" for term, weight in document['terms'].items())
+        return json.dumps([product_id, document['length'], document['meta'], terms], ensure_ascii=False) + '\n'
+    
+    @staticmethod
+    def _decode_entry(entry: List) -> Tuple[str, Optional[Dict]]:
+        product_id, length = entry[0], entry[1]
+        if length is None:
+            return product_id, None
+        parts = entry[3].split()
+        terms = {parts[i]: float(parts[i + 1]) for i in range(0, len(parts), 2)}
+        return product_id, {'terms': terms, 'length': length, 'meta': entry[2]}
+    
+    def _append_log(self, product_id: str, document: Optional[Dict]):
+        with open(self.index_path, 'a', encoding='utf-8') as f:
+            f.write(self._encode_entry(product_id, document))
+        self._log_entries += 1
+    
+    def add_product(self, product_id: str, data: Dict, comments: Optional[List[Dict]] = None):
+        """Indexar (ou reindexar) um produto e registrar no log"""
+        document = self.build_document(data, comments)
+        with self._lock:
+            self._apply(product_id, document)
+            self._append_log(product_id, document)
+    
+    def remove_product(self, product_id: str):
+        with self._lock:
+            if product_id in self._doc_lengths:
+                self._apply(product_id, None)
+                self._append_log(product_id, None)
+    
+    def _load_snapshot(self):
+        with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+            header = json.loads(f.readline())
+            ids = header['ids']
+            self._doc_lengths = dict(zip(ids, header['lengths']))
+            self._doc_meta = dict(zip(ids, header['meta']))
+            self._total_length = float(sum(header['lengths']))
+            # Linha por termo: "termo<TAB>deltas das posições<TAB>pesos", decodificada sem laço em Python
+            for line in f:
+                term, gaps, weights = line.rstrip('\n').split('\t')
+                positions = accumulate(map(int, gaps.split()))
+                self._postings[term] = dict(zip(map(ids.__getitem__, positions), map(float, weights.split())))
+    
+    def load(self) -> bool:
+        """Carregar snapshot e log persistidos; False se ainda não existirem"""
+        if not os.path.exists(self.snapshot_path) and not os.path.exists(self.index_path):
+            return False
+        
+        with self._lock:
+            if os.path.exists(self.snapshot_path):
+                self._load_snapshot()
+            
+            # Lista ordenada de termos montada uma vez no final, não com insort a cada termo novo
+            self._sorted_terms = None
+            if os.path.exists(self.index_path):
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            product_id, document = self._decode_entry(json.loads(line))
+                        except (ValueError, IndexError, TypeError):
+                            # Última linha incompleta (queda durante a escrita)
+                            continue
+                        self._log_entries += 1
+                        self._apply(product_id, document)
+            self._sorted_terms = sorted(self._postings)
+            
+            # Compactar quando o log cresce demais
+            if self._log_entries > len(self._doc_lengths) // 4 + 1000:
+                self.compact()
+        return True
+    
+    def compact(self):
+        """Gravar um snapshot com o estado atual e esvaziar o log"""
+        with self._lock:
+            ids = list(self._doc_lengths)
+            positions = {product_id: i for i, product_id in enumerate(ids)}
+            header = {
+                'ids': ids,
+                'lengths': [self._doc_lengths[product_id] for product_id in ids],
+                'meta': [self._doc_meta[product_id] for product_id in ids]
+            }
+            tmp_path = f"{self.snapshot_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps(header, ensure_ascii=False) + '\n')
+                for term, postings in self._postings.items():
+                    entries = sorted((positions[product_id], weight) for product_id, weight in postings.items())
+                    previous = 0
+                    gaps = []
+                    for position, _ in entries:
+                        gaps.append(str(position - previous))
+                        previous = position
+                    weights = ' '.join(f"{weight:g}" for _, weight in entries)
+                    f.write(f"{term}\t{' '.join(gaps)}\t{weights}\n")
+            os.replace(tmp_path, self.snapshot_path)
+            # Uma queda antes daqui só faz o log ser reaplicado sobre o snapshot (idempotente)
+            open(self.index_path, 'w').close()
+            self._log_entries = 0
+    
+    def _expand_prefix(self, prefix: str) -> Tuple[List[str], bool]:
+        """Termos com o prefixo; acima do limite, ficam os de maior frequência (e True = truncado)"""
+        start = bisect.bisect_left(self._sorted_terms, prefix)
+        # Termos só têm [a-z0-9], então prefix + '~' fecha o intervalo
+        end = bisect.bisect_left(self._sorted_terms, prefix + '~', start)
+        expansions = self._sorted_terms[start:end]
+        if len(expansions) <= self.MAX_PREFIX_EXPANSIONS:
+            return expansions, False
+        return heapq.nlargest(self.MAX_PREFIX_EXPANSIONS, expansions, key=lambda t: len(self._postings[t])), True
+    
+    def _impact_order(self, term: str) -> Dict[float, List[Tuple[float, str]]]:
+        """Postings do termo agrupadas por peso, cada grupo do menor para o maior documento.
+        
+        Montada na primeira busca pelo termo e mantida por _apply depois disso.
+        """
+        impacts = self._impacts.get(term)
+        if impacts is None:
+            impacts = {}
+            doc_lengths = self._doc_lengths
+            for product_id, weight in self._postings[term].items():
+                impacts.setdefault(weight, []).append((doc_lengths[product_id], product_id))
+            for bucket in impacts.values():
+                bucket.sort()
+            self._impacts[term] = impacts
+        return impacts
+    
+    def _impact_stream(self, term: str, idf: float, norm_base: float,
+                       norm_scale: float) -> Iterator[Tuple[float, str]]:
+        """(-score, id) das postings do termo em ordem decrescente de score.
+        
+        Com o mesmo peso, o documento mais curto pontua mais; basta intercalar os grupos de peso.
+        """
+        def bucket_scores(weight: float, bucket: List[Tuple[float, str]]):
+            numerator = idf * weight
+            base = weight + norm_base
+            for length, product_id in bucket:
+                yield -numerator / (base + norm_scale * length), product_id
+        
+        return heapq.merge(*(bucket_scores(weight, bucket) for weight, bucket in self._impact_order(term).items()))
+    
+    def _score_all(self, candidates, term_postings: List[Tuple[Dict[str, float], float]], norm_base: float,
+                   norm_scale: float) -> Dict[str, float]:
+        """BM25 de todos os candidatos, termo a termo sobre listas (sem uma chamada por documento).
+        
+        Termo com menos postings que candidatos percorre as próprias postings; os demais, os candidatos.
+        """
+        ids = list(candidates)
+        norms = [norm_base + norm_scale * length for length in map(self._doc_lengths.__getitem__, ids)]
+        totals = [0.0] * len(ids)
+        positions = None
+        for postings, idf in term_postings:
+            if len(postings) < len(ids):
+                if positions is None:
+                    positions = {product_id: i for i, product_id in enumerate(ids)}
+                for product_id, tf in postings.items():
+                    i = positions.get(product_id)
+                    if i is not None:
+                        totals[i] += idf * tf / (tf + norms[i])
+            else:
+                totals = [total if tf is None else total + idf * tf / (tf + norm)
+                          for total, tf, norm in zip(totals, map(postings.get, ids), norms)]
+        return dict(zip(ids, totals))
+    
+    def _top_scores(self, streams: List[Tuple[str, Iterator[Tuple[float, str]]]], candidates,
+                    score: Callable[[str], float], k: int) -> Tuple[Dict[str, float], bool]:
+        """Pontuar candidatos na ordem de impacto até os k melhores estarem garantidos.
+        
+        As postings de todos os termos são lidas intercaladas, do maior score parcial para o menor,
+        e cada candidato novo recebe o score completo. Um documento ainda não lido soma no máximo o
+        último score lido de cada termo: quando o k-ésimo passa dessa soma, o topo está garantido.
+        Atingido o teto de documentos pontuados, as leituras seguintes só somam parciais e, no fim,
+        os melhores parciais são pontuados; parando no teto de leituras, retorna True (aproximado).
+        """
+        max_scored = max(self.MAX_SCORED_CANDIDATES, 2 * k)
+        max_reads = max(self.MAX_IMPACT_READS, 10 * k)
+        remaining = [len(self._postings[term]) for term, _ in streams]
+        frontier = [math.inf] * len(streams)
+        merged = heapq.merge(*(zip(stream, repeat(i)) for i, (_, stream) in enumerate(streams)))
+        scores: Dict[str, float] = {}
+        partial: Dict[str, float] = {}
+        best: List[float] = []
+        capped = exhausted = False
+        reads = 0
+        for (negative_score, product_id), i in merged:
+            frontier[i] = -negative_score
+            remaining[i] -= 1
+            reads += 1
+            if product_id in candidates and product_id not in scores:
+                if capped:
+                    partial[product_id] = partial.get(product_id, 0.0) - negative_score
+                else:
+                    value = scores[product_id] = score(product_id)
+                    if len(best) < k:
+                        heapq.heappush(best, value)
+                    elif value > best[0]:
+                        heapq.heapreplace(best, value)
+                    capped = len(scores) >= max_scored
+            if reads >= max_reads:
+                break
+            if not capped and reads % self.IMPACT_BATCH_SIZE == 0 and len(best) >= k:
+                # Termo ainda não esgotado vale no máximo o score atual da intercalação
+                threshold = sum(min(value, -negative_score) for value, left in zip(frontier, remaining) if left)
+                # Estritamente maior: empates com o k-ésimo ainda podem entrar pelo desempate por id
+                if best[0] > threshold + 1e-9:
+                    return scores, False
+        else:
+            # Tudo lido: os parciais dos candidatos não pontuados já estão completos
+            exhausted = True
+        
+        for product_id in heapq.nlargest(max_scored, partial, key=partial.__getitem__):
+            scores[product_id] = score(product_id)
+        return scores, not exhausted
+    
+    def search(self, query: str, prefix: bool = False, min_price: Optional[float] = None,
+               max_price: Optional[float] = None, min_rating: Optional[float] = None,
+               limit: int = 20, offset: int = 0) -> Dict:
+        """Busca ranqueada (BM25) com todos os termos obrigatórios.
+        
+        Termos terminados em '*' (ou o último termo, com prefix=True) casam por prefixo.
+        truncated indica prefixo com termos demais ou ranking interrompido no teto de pontuados.
+        """
+        raw_tokens = normalize_search_text(query).split()
+        query_terms = []
+        for i, raw in enumerate(raw_tokens):
+            is_prefix = raw.endswith('*') or (prefix and i == len(raw_tokens) - 1)
+            tokens = re.findall(r'[a-z0-9]+', raw)
+            for j, token in enumerate(tokens):
+                token_is_prefix = is_prefix and j == len(tokens) - 1
+                if token_is_prefix or (len(token) > 1 and token not in SEARCH_STOPWORDS):
+                    query_terms.append((token, token_is_prefix))
+        
+        if not query_terms:
+            return {'total': 0, 'truncated': False, 'results': []}
+        
+        with self._lock:
+            doc_count = len(self._doc_lengths)
+            avg_length = (self._total_length / doc_count) if doc_count else 0.0
+            
+            # Cada termo da consulta vira um grupo de termos do índice (vários, se for prefixo)
+            groups = []
+            truncated = False
+            for token, is_prefix in query_terms:
+                if is_prefix:
+                    terms, group_truncated = self._expand_prefix(token)
+                    truncated = truncated or group_truncated
+                else:
+                    terms = [token] if token in self._postings else []
+                if not terms:
+                    return {'total': 0, 'truncated': truncated, 'results': []}
+                groups.append(terms)
+            
+            # Interseção começando pelo grupo mais seletivo (termo único usa as próprias postings)
+            group_docs = []
+            for terms in groups:
+                if len(terms) == 1:
+                    group_docs.append(self._postings[terms[0]])
+                    continue
+                docs = set()
+                for term in terms:
+                    docs.update(self._postings[term])
+                group_docs.append(docs)
+            group_docs.sort(key=len)
+            candidates = group_docs[0] if len(group_docs) == 1 else set(group_docs[0]).intersection(*group_docs[1:])
+            
+            if min_price is not None or max_price is not None or min_rating is not None:
+                candidates = {
+                    product_id for product_id in candidates
+                    if self._matches_filters(self._doc_meta[product_id], min_price, max_price, min_rating)
+                }
+            
+            # BM25: idf calculado uma vez por termo, não por documento
+            k1, b = self.K1, self.B
+            norm_base = k1 * (1 - b) if avg_length else k1
+            norm_scale = k1 * b / avg_length if avg_length else 0.0
+            doc_lengths = self._doc_lengths
+            weighted_terms = []
+            for terms in groups:
+                for term in terms:
+                    df = len(self._postings[term])
+                    idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5)) * (k1 + 1)
+                    weighted_terms.append((term, idf))
+            term_postings = [(self._postings[term], idf) for term, idf in weighted_terms]
+            
+            k = offset + limit
+            exhaustive_cost = len(candidates) + sum(min(len(postings), len(candidates)) for postings, _ in term_postings)
+            postings_total = sum(len(postings) for postings, _ in term_postings)
+            if k <= 0:
+                scores = {}
+            elif (exhaustive_cost <= self.EXHAUSTIVE_SCORING_LIMIT
+                  or postings_total > self.MAX_POSTINGS_PER_CANDIDATE * len(candidates)):
+                scores = self._score_all(candidates, term_postings, norm_base, norm_scale)
+            else:
+                # Muitos candidatos: percorre as postings em ordem de impacto e para quando o topo está garantido
+                def score_document(product_id: str) -> float:
+                    norm = norm_base + norm_scale * doc_lengths[product_id]
+                    total = 0.0
+                    for postings, idf in term_postings:
+                        tf = postings.get(product_id)
+                        if tf is not None:
+                            total += idf * tf / (tf + norm)
+                    return total
+                
+                streams = [(term, self._impact_stream(term, idf, norm_base, norm_scale)) for term, idf in weighted_terms]
+                scores, capped = self._top_scores(streams, candidates, score_document, k)
+                truncated = truncated or capped
+            
+            # Só a página pedida precisa sair ordenada: corte no k-ésimo score, desempate por id
+            cutoff = heapq.nlargest(k, scores.values())[-1] if 0 < k < len(scores) else -math.inf
+            ranked = sorted((-value, product_id) for product_id, value in scores.items() if value >= cutoff)
+            page = [(product_id, -value) for value, product_id in ranked[offset:k]]
+            return {
+                'total': len(candidates),
+                'truncated': truncated,
+                'results': [
+                    {
+                        'id': product_id,
+                        'name': self._doc_meta[product_id].get('name', ''),
+                        'price': self._doc_meta[product_id].get('price', ''),
+                        'rating': self._doc_meta[product_id].get('rating', 0),
+                        'category': self._doc_meta[product_id].get('category', ''),
+                        'timestamp': self._doc_meta[product_id].get('timestamp', 0),
+                        'score': round(score, 4)
+                    }
+                    for product_id, score in page
+                ]
+            }
+    
+    @staticmethod
+    def _matches_filters(meta: Dict, min_price: Optional[float], max_price: Optional[float],
+                         min_rating: Optional[float]) -> bool:
+        price_value = meta.get('price_value')
+        if min_price is not None and (price_value is None or price_value < min_price):
+            return False
+        if max_price is not None and (price_value is None or price_value > max_price):
+            return False
+        return min_rating is None or meta.get('rating', 0) >= min_rating
+
+# 📥 Upload em streaming: JSON incremental com imagens base64 decodificadas direto em disco
+MAX_UPLOAD_BODY_SIZE = int(os.getenv('MAX_UPLOAD_BODY_SIZE', str(200 * 1024 * 1024)))
+MAX_UPLOAD_IMAGE_SIZE = int(os.getenv('MAX_UPLOAD_IMAGE_SIZE', str(20 * 1024 * 1024)))
+UPLOAD_STREAMING_THRESHOLD = int(os.getenv('UPLOAD_STREAMING_THRESHOLD', str(1024 * 1024)))
+MAX_UPLOAD_FORM_FIELD_SIZE = int(os.getenv('MAX_UPLOAD_FORM_FIELD_SIZE', str(10 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+DATA_URI_PATTERN = re.compile(r'data:image/([a-zA-Z0-9.+-]+);base64,')
+JSON_STRING_STOP = re.compile(r'["\\]')
+JSON_NUMBER_CHARS = set('+-0123456789.eE')
+JSON_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+# Caminhos (chaves de objeto; None = item de lista) cujas imagens vão direto para o disco.
+# Nos demais (variações, imagens de comentários) a string é mantida inteira.
+STREAMED_IMAGE_PATHS = {('images', None), ('images', None, 'base64'), ('product', 'images', None)}
+
+def sniff_image_type(file_data: bytes) -> Optional[tuple]:
+    """Identificar (extensão, mime) pelos primeiros bytes; None se não for JPEG/PNG/WebP"""
+    if file_data.startswith(b'\xff\xd8\xff'):
+        return 'jpg', 'image/jpeg'
+    elif file_data.startswith(b'\x89PNG'):
+        return 'png', 'image/png'
+    elif file_data.startswith(b'RIFF') and b'WEBP' in file_data[:12]:
+        return 'webp', 'image/webp'
+    return None
+
+def detect_image_type(file_data: bytes) -> tuple:
+    """Detectar (extensão, mime) pelos primeiros bytes, assumindo JPEG se desconhecido"""
+    return sniff_image_type(file_data) or ('jpg', 'image/jpeg')
+
+class UploadRejected(Exception):
+    """Upload recusado durante a leitura (corpo inválido ou grande demais)"""
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+class StreamedImage(str):
+    """Imagem base64 já gravada em disco; o valor da string é só o cabeçalho data:image.
+    
+    Com error preenchido, a imagem foi descartada (base64 inválido ou grande demais) e não há arquivo.
+    """
+    def __new__(cls, header: str, local_path: Optional[str], ext: str, mime_type: str, size: int,
+                error: Optional[str] = None):
+        obj = super().__new__(cls, header)
+        obj.local_path = local_path
+        obj.ext = ext
+        obj.mime_type = mime_type
+        obj.size = size
+        obj.error = error
+        return obj
+
+class StreamingJSONIngestor:
+    """Parser JSON incremental: lê o corpo em blocos e grava imagens base64 sem montar a string inteira"""
+    MAX_DEPTH = 64
+    HEADER_PEEK = 64
+    
+    def __init__(self, stream, images_dir: str, max_body_size: int = MAX_UPLOAD_BODY_SIZE,
+                 max_image_size: int = MAX_UPLOAD_IMAGE_SIZE, chunk_size: int = UPLOAD_CHUNK_SIZE):
+        self.stream = stream
+        self.images_dir = images_dir
+        self.max_body_size = max_body_size
+        self.max_image_size = max_image_size
+        self.chunk_size = chunk_size
+        self.bytes_read = 0
+        self.streamed_files: List[str] = []
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+    
+    def parse(self) -> Any:
+        try:
+            value = self._parse_value(())
+            if self._peek():
+                raise UploadRejected("JSON inválido: dados extras após o documento")
+            return value
+        except UnicodeDecodeError:
+            raise UploadRejected("JSON inválido: corpo não está em UTF-8")
+    
+    def cleanup(self):
+        """Remover imagens gravadas que não foram aproveitadas pelo processamento"""
+        for path in self.streamed_files:
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError as e:
+                logger.warning(f"⚠️ Não foi possível remover {path}: {e}")
+    
+    # Leitura do corpo
+    def _fill(self) -> bool:
+        """Ler mais um bloco do corpo; False no fim"""
+        if self._eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self._eof = True
+            text = self._decoder.decode(b'', final=True)
+        else:
+            self.bytes_read += len(chunk)
+            if self.bytes_read > self.max_body_size:
+                raise UploadRejected(f"Corpo excede o limite de {self.max_body_size} bytes", 413)
+            text = self._decoder.decode(chunk)
+        self._buffer = self._buffer[self._pos:] + text
+        self._pos = 0
+        return bool(text) or not self._eof
+    
+    def _peek(self) -> str:
+        """Próximo caractere relevante (pulando espaços) sem consumir; '' no fim"""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in ' \t\r\n':
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ''
+    
+    def _read_char(self) -> str:
+        if self._pos >= len(self._buffer):
+            while self._pos >= len(self._buffer):
+                if not self._fill():
+                    raise UploadRejected("JSON inválido: fim inesperado")
+        char = self._buffer[self._pos]
+        self._pos += 1
+        return char
+    
+    def _expect(self, char: str):
+        if self._peek() != char:
+            raise UploadRejected(f"JSON inválido: esperado '{char}'")
+        self._pos += 1
+    
+    # Valores
+    def _parse_value(self, path: Tuple) -> Any:
+        if len(path) > self.MAX_DEPTH:
+            raise UploadRejected("JSON inválido: aninhamento profundo demais")
+        
+        char = self._peek()
+        if char == '{':
+            return self._parse_object(path)
+        if char == '[':
+            return self._parse_array(path)
+        if char == '"':
+            self._pos += 1
+            return self._parse_string_value(path)
+        if char and char in JSON_NUMBER_CHARS:
+            return self._parse_number()
+        for literal, value in (('true', True), ('false', False), ('null', None)):
+            if char == literal[0]:
+                if ''.join(self._read_char() for _ in literal) != literal:
+                    raise UploadRejected("JSON inválido: literal desconhecido")
+                return value
+        raise UploadRejected("JSON inválido: valor inesperado")
+    
+    def _parse_object(self, path: Tuple) -> Dict:
+        self._expect('{')
+        result = {}
+        if self._peek() == '}':
+            self._pos += 1
+            return result
+        while True:
+            self._expect('"')
+            key = ''.join(self._read_string_segments())
+            self._expect(':')
+            result[key] = self._parse_value(path + (key,))
+            char = self._peek()
+            self._pos += 1
+            if char == '}':
+                return result
+            if char != ',':
+                raise UploadRejected("JSON inválido: esperado ',' ou '}'")
+    
+    def _parse_array(self, path: Tuple) -> List:
+        self._expect('[')
+        result = []
+        if self._peek() == ']':
+            self._pos += 1
+            return result
+        while True:
+            result.append(self._parse_value(path + (None,)))
+            char = self._peek()
+            self._pos += 1
+            if char == ']':
+                return result
+            if char != ',':
+                raise UploadRejected("JSON inválido: esperado ',' ou ']'")
+    
+    def _parse_number(self) -> Any:
+        chars = []
+        while True:
+            if self._pos >= len(self._buffer) and not self._fill():
+                break
+            char = self._buffer[self._pos]
+            if char not in JSON_NUMBER_CHARS:
+                break
+            chars.append(char)
+            self._pos += 1
+        try:
+            return json.loads(''.join(chars))
+        except ValueError:
+            raise UploadRejected("JSON inválido: número malformado")
+    
+    def _read_string_segments(self):
+        """Gerar trechos já decodificados da string atual (a aspa de abertura já foi consumida)"""
+        while True:
+            if self._pos >= len(self._buffer) and not self._fill():
+                raise UploadRejected("JSON inválido: string não terminada")
+            match = JSON_STRING_STOP.search(self._buffer, self._pos)
+            if match is None:
+                segment = self._buffer[self._pos:]
+                self._pos = len(self._buffer)
+                yield segment
+                continue
+            if match.start() > self._pos:
+                yield self._buffer[self._pos:match.start()]
+            self._pos = match.end()
+            if match.group() == '"':
+                return
+            yield self._read_escape()
+    
+    def _read_escape(self) -> str:
+        char = self._read_char()
+        if char in JSON_ESCAPES:
+            return JSON_ESCAPES[char]
+        if char != 'u':
+            raise UploadRejected("JSON inválido: escape desconhecido")
+        code = self._parse_hex4(''.join(self._read_char() for _ in range(4)))
+        # Par substituto (caracteres fora do BMP, ex.: emojis); sem par válido fica o substituto isolado,
+        # como no json.loads, e o próximo escape é lido normalmente
+        if 0xD800 <= code < 0xDC00:
+            following = self._peek_raw(6)
+            if following[:2] == '\\u' and len(following) == 6:
+                low = self._parse_hex4(following[2:])
+                if 0xDC00 <= low < 0xE000:
+                    self._pos += 6
+                    return chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00))
+        return chr(code)
+    
+    @staticmethod
+    def _parse_hex4(digits: str) -> int:
+        if len(digits) != 4 or not all(c in string.hexdigits for c in digits):
+            raise UploadRejected("JSON inválido: escape \\u malformado")
+        return int(digits, 16)
+    
+    def _peek_raw(self, count: int) -> str:
+        while len(self._buffer) - self._pos < count and self._fill():
+            pass
+        return self._buffer[self._pos:self._pos + count]
+    
+    def _parse_string_value(self, path: Tuple) -> str:
+        segments = self._read_string_segments()
+        if path not in STREAMED_IMAGE_PATHS:
+            return ''.join(segments)
+        
+        key = path[-1]
+        head = ''
+        for segment in segments:
+            head += segment
+            if len(head) >= self.HEADER_PEEK:
+                break
+        else:
+            # String terminou antes de chegar ao limite de espiada
+            if not (DATA_URI_PATTERN.match(head) or (key == 'base64' and head)):
+                return head
+            return self._stream_image(head, iter(()), key)
+        
+        if DATA_URI_PATTERN.match(head) or key == 'base64':
+            return self._stream_image(head, segments, key)
+        return head + ''.join(segments)
+    
+    def _stream_image(self, head: str, segments, key: Optional[str]) -> StreamedImage:
+        """Decodificar base64 em blocos múltiplos de 4 e gravar direto no disco"""
+        match = DATA_URI_PATTERN.match(head)
+        header = head[:match.end()] if match else ''
+        pending = head[match.end():] if match else head
+        
+        temp_path = os.path.join(self.images_dir, f"upload_{uuid.uuid4().hex[:12]}.part")
+        self.streamed_files.append(temp_path)
+        size = 0
+        first_bytes = b''
+        error = None
+        with open(temp_path, 'wb') as f:
+            while True:
+                # Depois de um erro o resto da string só é consumido, para seguir com o JSON
+                if error is None:
+                    pending = ''.join(pending.split())
+                    usable = len(pending) - len(pending) % 4
+                    if usable:
+                        try:
+                            decoded = base64.b64decode(pending[:usable], validate=True)
+                        except (binascii.Error, ValueError):
+                            error = "base64 inválido"
+                        else:
+                            pending = pending[usable:]
+                            size += len(decoded)
+                            if size > self.max_image_size:
+                                error = f"excede o limite de {self.max_image_size} bytes"
+                            else:
+                                if len(first_bytes) < 12:
+                                    first_bytes += decoded[:12]
+                                f.write(decoded)
+                
+                segment = next(segments, None)
+                if segment is None:
+                    break
+                pending = pending + segment if error is None else ''
+            
+            if pending and error is None:
+                try:
+                    decoded = base64.b64decode(pending + '=' * (-len(pending) % 4), validate=True)
+                except (binascii.Error, ValueError):
+                    error = "base64 inválido"
+                else:
+                    size += len(decoded)
+                    first_bytes += decoded[:12]
+                    f.write(decoded)
+        
+        if error is not None:
+            # Mesmo tratamento do upload pequeno: a imagem é ignorada e o restante do produto segue
+            os.remove(temp_path)
+            logger.warning(f"❌ Imagem ignorada no upload em streaming ({key or 'valor'}): {error}")
+            return StreamedImage(header, None, '', '', 0, error=error)
+        
+        if header:
+            subtype = match.group(1).lower()
+            ext = {'jpeg': 'jpg', 'jpg': 'jpg', 'png': 'png', 'webp': 'webp'}.get(subtype, 'jpg')
+            mime_type = f"image/{subtype}"
+        else:
+            ext, mime_type = detect_image_type(first_bytes)
+            header = f"data:{mime_type};base64,"
+        
+        logger.info(f"📥 Imagem gravada em streaming ({key or 'valor'}): {size} bytes")
+        return StreamedImage(header, temp_path, ext, mime_type, size)
+
+# 💬 Avaliações: armazenamento completo por produto com agregados pré-calculados
+class ReviewStore:
+    """Comentários em JSONL compacto + índice de offsets (8 bytes por comentário) + agregados.
+    
+    Por produto: <id>.jsonl (um comentário por linha), <id>.idx (offsets uint64) e <id>.meta.json.
+    """
+    
+    def __init__(self, reviews_dir: str):
+        self.reviews_dir = reviews_dir
+        self._lock = threading.Lock()
+    
+    def _path(self, product_id: str, suffix: str) -> str:
+        return os.path.join(self.reviews_dir, f"{product_id}{suffix}")
+    
+    @staticmethod
+    def empty_aggregates() -> Dict:
+        return {
+            'total': 0,
+            'average_rating': 0.0,
+            'rating_sum': 0,
+            'rating_histogram': {str(star): 0 for star in range(1, 6)},
+            'with_images': 0,
+            'with_text': 0,
+            'variations': {}
+        }
+    
+    @staticmethod
+    def _normalize_rating(value: Any) -> int:
+        try:
+            return min(5, max(1, int(round(float(value)))))
+        except (TypeError, ValueError):
+            return 5
+    
+    @classmethod
+    def summarize(cls, comments: List[Dict], aggregates: Optional[Dict] = None) -> Dict:
+        """Somar comentários aos agregados (sem gravar nada)"""
+        aggregates = aggregates or cls.empty_aggregates()
+        for comment in comments:
+            rating = cls._normalize_rating(comment.get('rating', 5))
+            aggregates['total'] += 1
+            aggregates['rating_sum'] += rating
+            aggregates['rating_histogram'][str(rating)] += 1
+            if comment.get('images'):
+                aggregates['with_images'] += 1
+            if str(comment.get('comment', '')).strip():
+                aggregates['with_text'] += 1
+            variation = str(comment.get('variation', '')).strip()
+            if variation:
+                aggregates['variations'][variation] = aggregates['variations'].get(variation, 0) + 1
+        
+        if aggregates['total']:
+            aggregates['average_rating'] = round(aggregates['rating_sum'] / aggregates['total'], 2)
+        return aggregates
+    
+    def add_comments(self, product_id: str, comments: List[Dict]) -> Dict:
+        """Anexar comentários e atualizar os agregados de forma incremental"""
+        with self._lock:
+            data_path = self._path(product_id, '.jsonl')
+            offset = os.path.getsize(data_path) if os.path.exists(data_path) else 0
+            offsets = array('Q')
+            with open(data_path, 'ab') as data_file:
+                for comment in comments:
+                    line = (json.dumps(comment, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+                    offsets.append(offset)
+                    data_file.write(line)
+                    offset += len(line)
+            
+            with open(self._path(product_id, '.idx'), 'ab') as index_file:
+                offsets.tofile(index_file)
+            
+            aggregates = self.summarize(comments, self.get_aggregates(product_id))
+            aggregates['updated_at'] = time.time()
+            
+            meta_path = self._path(product_id, '.meta.json')
+            with open(f"{meta_path}.tmp", 'w', encoding='utf-8') as f:
+                json.dump(aggregates, f, ensure_ascii=False)
+            os.replace(f"{meta_path}.tmp", meta_path)
+            
+            logger.info(f"💬 {len(comments)} comentários armazenados para {product_id} (total: {aggregates['total']})")
+            return aggregates
+    
+    def get_aggregates(self, product_id: str) -> Optional[Dict]:
+        meta_path = self._path(product_id, '.meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def get_all(self, product_id: str) -> List[Dict]:
+        data_path = self._path(product_id, '.jsonl')
+        if not os.path.exists(data_path):
+            return []
+        with open(data_path, 'rb') as data_file:
+            return [json.loads(line) for line in data_file.read().split(b'\n') if line]
+    
+    def get_page(self, product_id: str, offset: int, limit: int) -> List[Dict]:
+        """Ler apenas os comentários da página pedida, usando o índice de offsets"""
+        index_path = self._path(product_id, '.idx')
+        data_path = self._path(product_id, '.jsonl')
+        if not os.path.exists(index_path) or limit <= 0:
+            return []
+        
+        item_size = array('Q').itemsize
+        offsets = array('Q')
+        with open(index_path, 'rb') as index_file:
+            index_file.seek(offset * item_size)
+            offsets.frombytes(index_file.read((limit + 1) * item_size))
+        if not offsets:
+            return []
+        
+        with open(data_path, 'rb') as data_file:
+            data_file.seek(offsets[0])
+            if len(offsets) > limit:
+                raw = data_file.read(offsets[limit] - offsets[0])
+            else:
+                raw = data_file.read()
+        return [json.loads(line) for line in raw.split(b'\n') if line]
+
+# 🔥 Cache do proxy de imagens e pré-aquecimento após o upload
+IMAGE_WARMING_ENABLED = os.getenv('IMAGE_WARMING_ENABLED', '1').lower() in ('1', 'true', 'sim')
+IMAGE_WARMING_WORKERS = int(os.getenv('IMAGE_WARMING_WORKERS', '8'))
+WARM_THUMBNAILS = os.getenv('WARM_THUMBNAILS', '0').lower() in ('1', 'true', 'sim')
+THUMBNAIL_WIDTHS = tuple(int(w) for w in os.getenv('THUMBNAIL_WIDTHS', '150,300,600').split(','))
+# Tamanho máximo do cache em disco (0 = sem limite); acima disso remove os menos usados
+IMAGE_CACHE_MAX_BYTES = int(os.getenv('IMAGE_CACHE_MAX_BYTES', str(2 * 1024 * 1024 * 1024)))
+
+def extract_proxied_url(url: str) -> str:
+    """URL original por trás de uma URL do proxy (/proxy-image?url=...), como o proxy a receberia"""
+    parts = urlsplit(url)
+    if parts.path in ('/proxy-image', '/api/image-proxy'):
+        return parse_qs(parts.query).get('url', [url])[0]
+    return url
+
+class ImageCache:
+    """Cache em disco das imagens servidas pelo proxy (arquivo = sha1 da URL + largura), limitado por LRU"""
+    def __init__(self, cache_dir: str, max_bytes: int = IMAGE_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Tamanho de cada arquivo, do menos para o mais recentemente usado
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._scan()
+    
+    def _scan(self):
+        """Ordem inicial de uso pela data de modificação dos arquivos já em disco"""
+        found = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.path, stat.st_size))
+        for _, path, size in sorted(found):
+            self._entries[path] = size
+            self._total_bytes += size
+    
+    def path_for(self, url: str, width: Optional[int] = None) -> str:
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}_w{width}" if width else key)
+    
+    def get(self, url: str, width: Optional[int] = None) -> Optional[tuple]:
+        """Retorna (caminho, mime) se a imagem estiver no cache"""
+        path = self.path_for(url, width)
+        try:
+            with open(path, 'rb') as f:
+                _, mime_type = detect_image_type(f.read(12))
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if path in self._entries:
+                self._entries.move_to_end(path)
+        return path, mime_type
+    
+    def contains(self, url: str) -> bool:
+        return os.path.exists(self.path_for(url))
+    
+    def temp_path_for(self, url: str, width: Optional[int] = None) -> str:
+        """Arquivo temporário para escrita; publicado com commit() (troca atômica)"""
+        return f"{self.path_for(url, width)}.{uuid.uuid4().hex[:8]}.tmp"
+    
+    def commit(self, tmp_path: str, url: str, width: Optional[int] = None) -> str:
+        path = self.path_for(url, width)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+        
+        evicted = []
+        with self._lock:
+            self._total_bytes += size - self._entries.pop(path, 0)
+            self._entries[path] = size
+            while self.max_bytes and self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                old_path, old_size = self._entries.popitem(last=False)
+                self._total_bytes -= old_size
+                evicted.append(old_path)
+        for old_path in evicted:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+        if evicted:
+            logger.debug(f"🧹 Cache de imagens: {len(evicted)} arquivos removidos (limite {self.max_bytes} bytes)")
+        return path
+    
+    def put(self, url: str, content: bytes, width: Optional[int] = None) -> str:
+        tmp_path = self.temp_path_for(url, width)
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        return self.commit(tmp_path, url, width)
+    
+    def thumbnail(self, url: str, width: int) -> Optional[tuple]:
+        """Gerar (ou reaproveitar) miniatura a partir do original em cache; None sem Pillow"""
+        cached = self.get(url, width)
+        if cached or Image is None:
+            return cached
+        original = self.get(url)
+        if original is None:
+            return None
+        
+        try:
+            with Image.open(original[0]) as img:
+                if img.width > width:
+                    img.thumbnail((width, width * img.height // img.width))
+                output = io.BytesIO()
+                if img.mode in ('RGBA', 'LA', 'P'):
+                    img.save(output, format='PNG', optimize=True)
+                else:
+                    img.convert('RGB').save(output, format='JPEG', quality=85, optimize=True)
+        except Exception as e:
+            # Formato que o Pillow não abre (GIF animado, AVIF) ou arquivo truncado: quem chama serve o original
+            logger.warning(f"⚠️ Miniatura indisponível para {url[:50]}...: {e}")
+            return None
+        self.put(url, output.getvalue(), width)
+        return self.get(url, width)
+
+class ImageWarmer:
+    """Pré-carrega no cache do proxy as imagens de um produto, com concorrência limitada"""
+    def __init__(self, cache: ImageCache, max_workers: int = IMAGE_WARMING_WORKERS):
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='image-warmer')
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Dict] = {}
+    
+    @staticmethod
+    def collect_images(data: Dict) -> List[str]:
+        """URLs originais das imagens do produto e dos comentários"""
+        images = []
+        seen = set()
+        for img in data.get('images', []):
+            if isinstance(img, dict) and img.get('url', '').startswith('http'):
+                url = extract_proxied_url(img['url'])
+                if url not in seen:
+                    seen.add(url)
+                    images.append(url)
+        for comment in data.get('comments', []):
+            for img in comment.get('images', []):
+                url = extract_proxied_url(img.get('url', '') if isinstance(img, dict) else str(img))
+                if url.startswith('http') and url not in seen:
+                    seen.add(url)
+                    images.append(url)
+        return [url for url in images if is_allowed_image_url(url)]
+    
+    def schedule(self, product_id: str, data: Dict):
+        """Agendar o aquecimento em segundo plano (não bloqueia o upload).
+        
+        Imagens do produto já entram no cache durante o download do upload; aqui ficam só as que faltam.
+        """
+        images = self.collect_images(data)
+        if not images:
+            return
+        with self._lock:
+            self._jobs[product_id] = {'total': len(images), 'done': 0, 'failed': 0}
+        for url in images:
+            self._executor.submit(self._warm_one, product_id, url)
+        logger.info(f"🔥 Aquecimento agendado para {product_id}: {len(images)} imagens")
+    
+    def _warm_one(self, product_id: str, url: str):
+        ok = False
+        try:
+            if self.cache.contains(url):
+                ok = True
+            else:
+                response = fetch_upstream(url, headers=IMAGE_PROXY_HEADERS)
+                if response.status_code == 200:
+                    self.cache.put(url, response.content)
+                    ok = True
+            
+            if ok and WARM_THUMBNAILS:
+                for width in THUMBNAIL_WIDTHS:
+                    self.cache.thumbnail(url, width)
+        except Exception as e:
+            logger.warning(f"⚠️ Falha ao aquecer imagem {url[:50]}...: {e}")
+        finally:
+            with self._lock:
+                job = self._jobs[product_id]
+                job['done' if ok else 'failed'] += 1
+                # Job concluído: status() passa a ser calculado pelo próprio cache
+                if job['done'] + job['failed'] >= job['total']:
+                    del self._jobs[product_id]
+    
+    def status(self, product_id: str, data: Dict) -> Dict:
+        """Status warm/warming/partial/cold das imagens de um produto"""
+        with self._lock:
+            job = dict(self._jobs.get(product_id) or {})
+        if job:
+            return {'status': 'warming', **job}
+        
+        images = self.collect_images(data)
+        cached = sum(1 for url in images if self.cache.contains(url))
+        if cached == len(images):
+            status = 'warm'
+        elif cached == 0:
+            status = 'cold'
+        else:
+            status = 'partial'
+        return {'status': status, 'total': len(images), 'cached': cached}
+
+# 📈 Histórico de preço e estoque: linhas de largura fixa num arquivo por produto, só com append
+def product_name_history_key(data: Dict) -> str:
+    name = ' '.join(normalize_search_text(data.get('name', '')).split())
+    return 'n_' + hashlib.sha1(name.encode('utf-8')).hexdigest()[:16]
+
+def product_history_key(data: Dict) -> str:
+    """Chave estável entre re-extrações: IDs loja/item da URL da Shopee ou, sem URL, o nome"""
+    url = str(data.get('url') or '')
+    match = re.search(r'i\.(\d+)\.(\d+)', url) or re.search(r'/product/(\d+)/(\d+)', url)
+    if match:
+        return f"{match.group(1)}_{match.group(2)}"
+    return product_name_history_key(data)
+
+class PriceHistoryStore:
+    """Um arquivo por produto (<chave>.bin) com uma linha de 20 bytes por coleta:
+    timestamp (uint32), preço, preço original, estoque e vendidos (int32, ordem nativa).
+    
+    Preços ficam em centavos; -1 marca valor desconhecido. A linha é gravada numa única escrita;
+    um resto incompleto (queda no meio) é descartado na leitura e truncado antes do próximo append.
+    """
+    COLUMNS = ('timestamp', 'price', 'original_price', 'stock', 'sold')
+    ROW = struct.Struct('=Iiiii')
+    UNKNOWN = -1
+    INT32_MAX = 2 ** 31 - 1
+    
+    def __init__(self, history_dir: str):
+        self.history_dir = history_dir
+        self._lock = threading.Lock()
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.history_dir, f"{key}.bin")
+    
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+    
+    def resolve_key(self, data: Dict) -> str:
+        """Chave do histórico de um produto, ligando a série pelo nome à chave da URL.
+        
+        Uploads antigos (sem URL) ficaram com a chave do nome; quando o produto passa a vir com URL
+        e a chave da URL ainda não tem histórico, a série do nome continua sendo usada. Produtos
+        diferentes com o mesmo nome normalizado e sem URL compartilham a mesma série.
+        """
+        key = product_history_key(data)
+        if key.startswith('n_') or self.exists(key):
+            return key
+        name_key = product_name_history_key(data)
+        return name_key if self.exists(name_key) else key
+    
+    @classmethod
+    def _to_int(cls, value: Any, scale: int = 1) -> int:
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            return cls.UNKNOWN
+        if number < 0:
+            return cls.UNKNOWN
+        return min(int(round(number * scale)), cls.INT32_MAX)
+    
+    def append(self, key: str, timestamp: float, price: Optional[float], original_price: Optional[float],
+               stock: Any, sold: Any):
+        """Anexar uma coleta (uma linha)"""
+        row = self.ROW.pack(
+            int(timestamp),
+            self._to_int(price, 100),
+            self._to_int(original_price, 100),
+            self._to_int(stock),
+            self._to_int(sold)
+        )
+        with self._lock:
+            with open(self._path(key), 'ab') as f:
+                size = f.seek(0, os.SEEK_END)
+                if size % self.ROW.size:
+                    f.truncate(size - size % self.ROW.size)
+                f.write(row)
+    
+    def load(self, key: str) -> Optional[Dict[str, array]]:
+        """Carregar as colunas a partir das linhas; um resto incompleto no final é descartado"""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            raw = f.read()
+        raw = raw[:len(raw) - len(raw) % self.ROW.size]
+        
+        # Todos os campos têm 4 bytes: coluna i = valores i, i+5, i+10, ...
+        signed = array('i')
+        signed.frombytes(raw)
+        unsigned = array('I')
+        unsigned.frombytes(raw)
+        width = len(self.COLUMNS)
+        columns = {'timestamp': unsigned[0::width]}
+        for i, column in enumerate(self.COLUMNS[1:], start=1):
+            columns[column] = signed[i::width]
+        return columns
+    
+    def query(self, key: str, start: Optional[float] = None, end: Optional[float] = None,
+              interval: Optional[int] = None, points: Optional[int] = None) -> Optional[Dict]:
+        """Série no intervalo [start, end], opcionalmente agregada em baldes de `interval` segundos
+        (ou no máximo `points` baldes). Em cada balde vale o último valor, com mínimo/máximo do preço.
+        """
+        columns = self.load(key)
+        if columns is None:
+            return None
+        
+        timestamps = columns['timestamp']
+        lo = bisect.bisect_left(timestamps, int(start)) if start is not None else 0
+        hi = bisect.bisect_right(timestamps, int(end)) if end is not None else len(timestamps)
+        
+        if points and not interval and hi - lo > points:
+            interval = max(1, math.ceil((timestamps[hi - 1] - timestamps[lo] + 1) / points))
+        
+        def cents(value: int) -> Optional[float]:
+            return None if value == self.UNKNOWN else value / 100
+        
+        def count(value: int) -> Optional[int]:
+            return None if value == self.UNKNOWN else value
+        
+        series = {'timestamp': [], 'price': [], 'original_price': [], 'stock': [], 'sold': []}
+        if not interval:
+            series['timestamp'] = timestamps[lo:hi].tolist()
+            series['price'] = [cents(v) for v in columns['price'][lo:hi]]
+            series['original_price'] = [cents(v) for v in columns['original_price'][lo:hi]]
+            series['stock'] = [count(v) for v in columns['stock'][lo:hi]]
+            series['sold'] = [count(v) for v in columns['sold'][lo:hi]]
+            return {'total_points': hi - lo, 'interval': None, 'series': series}
+        
+        series['price_min'] = []
+        series['price_max'] = []
+        i = lo
+        while i < hi:
+            bucket_end = timestamps[i] - timestamps[i] % interval + interval
+            known_prices = []
+            while i < hi and timestamps[i] < bucket_end:
+                if columns['price'][i] != self.UNKNOWN:
+                    known_prices.append(columns['price'][i])
+                i += 1
+            last = i - 1
+            series['timestamp'].append(timestamps[last])
+            series['price'].append(cents(columns['price'][last]))
+            series['price_min'].append(cents(min(known_prices)) if known_prices else None)
+            series['price_max'].append(cents(max(known_prices)) if known_prices else None)
+            series['original_price'].append(cents(columns['original_price'][last]))
+            series['stock'].append(count(columns['stock'][last]))
+            series['sold'].append(count(columns['sold'][last]))
+        return {'total_points': hi - lo, 'interval': interval, 'series': series}
+
 class JSONLandingGenerator:
     def __init__(self):
         # Criar pastas necessárias
         self.uploads_dir = "uploads"
         self.images_dir = "product_images"
         self.generated_dir = "generated_pages"
+        self.index_dir = "indexes"
+        self.reviews_dir = "reviews"
+        self.image_cache_dir = "image_cache"
+        self.history_dir = "price_history"
         
-        for directory in [self.uploads_dir, self.images_dir, self.generated_dir]:
+        new_history = not os.path.exists(self.history_dir)
+        for directory in [self.uploads_dir, self.images_dir, self.generated_dir, self.index_dir, self.reviews_dir,
+                          self.image_cache_dir, self.history_dir]:
             if not os.path.exists(directory):
                 os.makedirs(directory)
+        
+        self.search_index = ProductSearchIndex(os.path.join(self.index_dir, "search_index.jsonl"))
+        self.review_store = ReviewStore(self.reviews_dir)
+        self.image_cache = ImageCache(self.image_cache_dir)
+        self.image_warmer = ImageWarmer(self.image_cache)
+        self.price_history = PriceHistoryStore(self.history_dir)
+        if new_history:
+            self._backfill_price_history()
+        self._load_search_index()
+    
+    def _backfill_price_history(self):
+        """Montar o histórico a partir dos uploads já existentes (só na primeira execução)"""
+        try:
+            snapshots = []
+            for filename in os.listdir(self.uploads_dir):
+                if filename.endswith('.json'):
+                    data = self.get_product_data(filename[:-5])
+                    if data:
+                        snapshots.append(data)
+            for data in sorted(snapshots, key=lambda d: d.get('timestamp', 0)):
+                self._record_price_history(data)
+            logger.info(f"📈 Histórico de preços montado a partir de {len(snapshots)} uploads")
+        except Exception as e:
+            logger.error(f"❌ Erro ao montar histórico de preços: {e}")
+    
+    def _record_price_history(self, data: Dict):
+        self.price_history.append(
+            data.get('historyKey') or self.price_history.resolve_key(data),
+            data.get('timestamp') or time.time(),
+            parse_price_value(data.get('price')),
+            parse_price_value(data.get('originalPrice')),
+            data.get('stock'),
+            data.get('sold')
+        )
+    
+    def _load_search_index(self):
+        """Carregar índice de busca; indexa os produtos que faltam e remove os apagados de uploads/"""
+        try:
+            loaded = self.search_index.load()
+            on_disk = {filename[:-5] for filename in os.listdir(self.uploads_dir) if filename.endswith('.json')}
+            stale = [product_id for product_id in self.search_index.product_ids() if product_id not in on_disk]
+            for product_id in stale:
+                self.search_index.remove_product(product_id)
+            missing = [product_id for product_id in on_disk if product_id not in self.search_index]
+            for product_id in missing:
+                data = self.get_product_data(product_id)
+                if data:
+                    self.search_index.add_product(product_id, data, self.review_store.get_all(product_id) or None)
+            logger.info(f"🔎 Índice de busca {'carregado' if loaded else 'criado'}: {len(self.search_index)} produtos "
+                        f"({len(missing)} indexados agora, {len(stale)} removidos)")
+        except Exception as e:
+            logger.error(f"❌ Erro ao carregar índice de busca: {e}")
     
     def process_json_upload(self, json_data: Dict, uploaded_images: List = None) -> Dict:
         """Processar dados JSON e gerar landing page"""
@@ -55,6 +1779,10 @@ class JSONLandingGenerator:
             # Gerar ID único para o produto
             product_id = str(uuid.uuid4())[:8]
             
+            # Guardar todos os comentários; o produto mantém só os 5 primeiros para a página
+            all_comments = self._process_comments(validated_data, limit=None)
+            review_summary = ReviewStore.summarize(all_comments)
+            
             # Estruturar dados finais
             final_data = {
                 "id": product_id,
@@ -79,12 +1807,22 @@ class JSONLandingGenerator:
                 "model": validated_data.get('model', ''),
                 "colors": validated_data.get('colors', []),
                 "sizes": validated_data.get('sizes', []),
-                "comments": self._process_comments(validated_data),
+                "comments": all_comments[:5],
+                "reviewSummary": review_summary,
+                "historyKey": self.price_history.resolve_key(validated_data),
                 "timestamp": time.time()
             }
             
-            # Salvar dados processados
-            self._save_product_data(product_id, final_data)
+            # Salvar dados processados; comentários, histórico e aquecimento só se o produto existir
+            if self._save_product_data(product_id, final_data, all_comments):
+                self.review_store.add_comments(product_id, all_comments)
+                
+                # Registrar preço/estoque desta coleta no histórico
+                self._record_price_history(final_data)
+                
+                # Aquecer o cache do proxy para a primeira visita à landing page
+                if IMAGE_WARMING_ENABLED:
+                    self.image_warmer.schedule(product_id, final_data)
             
             logger.info(f"✅ Produto processado com sucesso! ID: {product_id}")
             
@@ -95,6 +1833,9 @@ class JSONLandingGenerator:
                 "message": "Dados processados com sucesso!"
             }
             
+        except UploadRejected:
+            # Recusa com status próprio (ex.: 413), tratada pela rota
+            raise
         except Exception as e:
             logger.error(f"❌ Erro ao processar JSON: {e}")
             return {"error": f"Erro no processamento: {str(e)}"}
@@ -145,7 +1886,9 @@ class JSONLandingGenerator:
                 'brand': str(data.get('brand', '')).strip(),
                 'model': str(data.get('model', '')).strip(),
                 'colors': data.get('colors', []),
-                'sizes': data.get('sizes', [])
+                'sizes': data.get('sizes', []),
+                'comments': data.get('comments', []),
+                'url': str(data.get('url', '')).strip()
             }
             
             return normalized
@@ -266,7 +2009,7 @@ class JSONLandingGenerator:
                 'model': '',
                 'colors': colors,
                 'sizes': sizes,
-                'comments': self._process_comments({'comments': comments}),
+                'comments': self._process_comments({'comments': comments}, limit=None),
                 'url': data.get('url', ''),
                 'extractedAt': data.get('extractedAt', '')
             }
@@ -415,6 +2158,8 @@ class JSONLandingGenerator:
                 saved_file = self._save_uploaded_image(uploaded_file, f"uploaded_{i+1}")
                 if saved_file:
                     processed_images.append(saved_file)
+            except UploadRejected:
+                raise
             except Exception as e:
                 logger.warning(f"❌ Erro ao processar arquivo enviado {i+1}: {e}")
         
@@ -423,7 +2168,7 @@ class JSONLandingGenerator:
     def _download_image_from_url(self, url: str, filename: str) -> Optional[Dict]:
         """Baixar imagem de URL"""
         try:
-            response = requests.get(url, timeout=10)
+            response = fetch_upstream(url)
             if response.status_code == 200:
                 # Determinar extensão
                 content_type = response.headers.get('content-type', '')
@@ -442,6 +2187,9 @@ class JSONLandingGenerator:
                 with open(filepath, 'wb') as f:
                     f.write(response.content)
                 
+                # Semear o cache do proxy já com estes bytes (o arquivo local pode ser sobrescrito por outro upload)
+                self._seed_image_cache(url, response.content)
+                
                 # Converter para base64
                 img_base64 = base64.b64encode(response.content).decode('utf-8')
                 
@@ -458,9 +2206,34 @@ class JSONLandingGenerator:
         
         return None
     
+    def _seed_image_cache(self, url: str, content: bytes):
+        if not IMAGE_WARMING_ENABLED:
+            return
+        url = extract_proxied_url(url)
+        if not is_allowed_image_url(url):
+            return
+        try:
+            self.image_cache.put(url, content)
+        except OSError as e:
+            logger.warning(f"⚠️ Não foi possível semear o cache com {url[:50]}...: {e}")
+    
     def _save_base64_image(self, base64_data: str, filename: str) -> Optional[Dict]:
         """Salvar imagem base64"""
         try:
+            # Já decodificada em disco pelo upload em streaming: só renomear
+            if isinstance(base64_data, StreamedImage):
+                if base64_data.error:
+                    return None
+                filename_with_ext = f"{filename}.{base64_data.ext}"
+                filepath = os.path.join(self.images_dir, filename_with_ext)
+                os.replace(base64_data.local_path, filepath)
+                return {
+                    'local_path': filepath,
+                    'filename': filename_with_ext,
+                    'size': base64_data.size,
+                    'type': base64_data.mime_type
+                }
+            
             # Extrair dados do base64
             if ',' in base64_data:
                 header, data = base64_data.split(',', 1)
@@ -499,22 +2272,14 @@ class JSONLandingGenerator:
         
         return None
     
-    def _save_uploaded_image(self, file_data: bytes, filename: str) -> Optional[Dict]:
-        """Salvar arquivo de imagem enviado"""
+    def _save_uploaded_image(self, file_data: Any, filename: str) -> Optional[Dict]:
+        """Salvar arquivo de imagem enviado (bytes ou arquivo do multipart)"""
         try:
+            if hasattr(file_data, 'read'):
+                return self._stream_uploaded_image(file_data, filename)
+            
             # Detectar tipo de arquivo pelos primeiros bytes
-            if file_data.startswith(b'\xff\xd8\xff'):
-                ext = 'jpg'
-                mime_type = 'image/jpeg'
-            elif file_data.startswith(b'\x89PNG'):
-                ext = 'png'
-                mime_type = 'image/png'
-            elif file_data.startswith(b'RIFF') and b'WEBP' in file_data[:12]:
-                ext = 'webp'
-                mime_type = 'image/webp'
-            else:
-                ext = 'jpg'
-                mime_type = 'image/jpeg'
+            ext, mime_type = detect_image_type(file_data)
             
             filename_with_ext = f"{filename}.{ext}"
             filepath = os.path.join(self.images_dir, filename_with_ext)
@@ -533,13 +2298,60 @@ class JSONLandingGenerator:
                 'type': mime_type
             }
             
+        except UploadRejected:
+            raise
         except Exception as e:
             logger.warning(f"❌ Erro ao salvar arquivo enviado: {e}")
         
         return None
     
-    def _save_product_data(self, product_id: str, data: Dict):
-        """Salvar dados do produto"""
+    def _stream_uploaded_image(self, file_storage, filename: str) -> Optional[Dict]:
+        """Copiar parte do multipart para o disco em blocos, sem passar por base64"""
+        stream = getattr(file_storage, 'stream', file_storage)
+        original_filename = getattr(file_storage, 'filename', '') or ''
+        too_large = f"Imagem excede o limite de {MAX_UPLOAD_IMAGE_SIZE} bytes: {original_filename or filename}"
+        
+        # Tamanho conhecido (parte já bufferizada pelo Werkzeug): recusar antes de criar o arquivo
+        if getattr(stream, 'seekable', lambda: False)():
+            start = stream.tell()
+            total = stream.seek(0, os.SEEK_END) - start
+            stream.seek(start)
+            if total > MAX_UPLOAD_IMAGE_SIZE:
+                raise UploadRejected(too_large, 413)
+        
+        first_chunk = stream.read(UPLOAD_CHUNK_SIZE)
+        image_type = sniff_image_type(first_chunk)
+        if image_type is None:
+            raise UploadRejected(f"Arquivo não é JPEG/PNG/WebP: {original_filename or filename}")
+        ext, mime_type = image_type
+        
+        filename_with_ext = f"{filename}.{ext}"
+        filepath = os.path.join(self.images_dir, filename_with_ext)
+        size = 0
+        with open(filepath, 'wb') as f:
+            chunk = first_chunk
+            while chunk:
+                size += len(chunk)
+                if size > MAX_UPLOAD_IMAGE_SIZE:
+                    break
+                f.write(chunk)
+                chunk = stream.read(UPLOAD_CHUNK_SIZE)
+        
+        if size > MAX_UPLOAD_IMAGE_SIZE:
+            # Não deixar o arquivo parcial no lugar da imagem
+            os.remove(filepath)
+            raise UploadRejected(too_large, 413)
+        
+        return {
+            'local_path': filepath,
+            'filename': filename_with_ext,
+            'original_filename': original_filename,
+            'size': size,
+            'type': mime_type
+        }
+    
+    def _save_product_data(self, product_id: str, data: Dict, comments: Optional[List[Dict]] = None) -> bool:
+        """Salvar dados do produto e indexá-lo para busca (com todos os comentários, se informados)"""
         try:
             filepath = os.path.join(self.uploads_dir, f"{product_id}.json")
             with open(filepath, 'w', encoding='utf-8') as f:
@@ -547,6 +2359,13 @@ class JSONLandingGenerator:
             logger.info(f"✅ Dados salvos: {filepath}")
         except Exception as e:
             logger.error(f"❌ Erro ao salvar dados: {e}")
+            return False
+        
+        try:
+            self.search_index.add_product(product_id, data, comments)
+        except Exception as e:
+            logger.error(f"❌ Erro ao indexar produto {product_id}: {e}")
+        return True
     
     def get_product_data(self, product_id: str) -> Optional[Dict]:
         """Recuperar dados do produto"""
@@ -560,8 +2379,8 @@ class JSONLandingGenerator:
         
         return None
     
-    def _process_comments(self, validated_data: Dict) -> List[Dict]:
-        """Processar comentários extraídos da Shopee"""
+    def _process_comments(self, validated_data: Dict, limit: Optional[int] = 5) -> List[Dict]:
+        """Processar comentários extraídos da Shopee (limit=None processa todos)"""
         try:
             # Extrair comentários do JSON da extensão
             comments = validated_data.get('comments', [])
@@ -572,8 +2391,8 @@ class JSONLandingGenerator:
             
             processed_comments = []
             
-            # Processar apenas os primeiros 5 comentários
-            for comment in comments[:5]:
+            # Processar apenas os primeiros comentários (5 por padrão)
+            for comment in (comments[:limit] if limit else comments):
                 if isinstance(comment, dict):
                     # Processar imagens do comentário
                     comment_images = []
@@ -604,9 +2423,9 @@ class JSONLandingGenerator:
                                         'alt': img_data.get('alt', 'Imagem do comentário')
                                     })
                     
-                    logger.info(f"🖼️ DEBUG Backend - Usuário {comment.get('user', 'Anônimo')}: {len(comment_images)} imagens processadas")
+                    logger.debug(f"🖼️ DEBUG Backend - Usuário {comment.get('user', 'Anônimo')}: {len(comment_images)} imagens processadas")
                     if comment_images:
-                        logger.info(f"URLs das imagens: {[img['url'][:80] + '...' if len(img['url']) > 80 else img['url'] for img in comment_images]}")
+                        logger.debug(f"URLs das imagens: {[img['url'][:80] + '...' if len(img['url']) > 80 else img['url'] for img in comment_images]}")
                     
                     processed_comment = {
                         'user': comment.get('user', 'Usuário Anônimo'),
@@ -621,7 +2440,7 @@ class JSONLandingGenerator:
             
             logger.info(f"✅ Processados {len(processed_comments)} comentários com imagens")
             for i, comment in enumerate(processed_comments):
-                logger.info(f"Comentário {i+1} - {comment['user']}: {len(comment['images'])} imagens")
+                logger.debug(f"Comentário {i+1} - {comment['user']}: {len(comment['images'])} imagens")
             return processed_comments
             
         except Exception as e:
@@ -657,19 +2476,32 @@ def health():
     return jsonify({
         "status": "ok", 
         "message": "🎯 JSON Landing Page Generator - Ativo!",
-        "version": "1.0"
+        "version": "1.0",
+        "upstream": circuit_breaker.snapshot(),
+        "admission": {pool: limits['concurrency'].snapshot() for pool, limits in ROUTE_LIMITS.items()}
     })
 
 @app.route('/api/upload-json', methods=['POST'])
+@admission_control('upload')
 def upload_json():
+    ingestor = None
     try:
         # Verificar se há dados JSON
-        if request.is_json:
-            json_data = request.get_json()
-        else:
+        if not request.is_json:
             return jsonify({"error": "Dados JSON são obrigatórios"}), 400
         
-        logger.info("🎯 Recebendo upload de JSON...")
+        content_length = request.content_length
+        if content_length and content_length > MAX_UPLOAD_BODY_SIZE:
+            return jsonify({"error": f"Corpo excede o limite de {MAX_UPLOAD_BODY_SIZE} bytes"}), 413
+        
+        # Corpos grandes (ou sem tamanho declarado) são lidos em streaming
+        if content_length is None or content_length > UPLOAD_STREAMING_THRESHOLD:
+            logger.info("🎯 Recebendo upload de JSON em streaming...")
+            ingestor = StreamingJSONIngestor(request.stream, generator.images_dir)
+            json_data = ingestor.parse()
+        else:
+            logger.info("🎯 Recebendo upload de JSON...")
+            json_data = request.get_json()
         
         # Processar dados
         result = generator.process_json_upload(json_data)
@@ -679,9 +2511,17 @@ def upload_json():
         else:
             return jsonify(result), 400
     
+    except UploadRejected as e:
+        logger.warning(f"⚠️ Upload recusado: {e}")
+        return jsonify({"error": str(e)}), e.status_code
+    
     except Exception as e:
         logger.error(f"❌ Erro no upload: {e}")
         return jsonify({"error": str(e)}), 500
+    
+    finally:
+        if ingestor:
+            ingestor.cleanup()
 
 @app.route('/api/product/<product_id>', methods=['GET'])
 def get_product(product_id):
@@ -694,6 +2534,66 @@ def get_product(product_id):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/product/<product_id>/comments', methods=['GET'])
+def get_product_comments(product_id):
+    """Comentários paginados + agregados pré-calculados"""
+    try:
+        aggregates = generator.review_store.get_aggregates(product_id)
+        if aggregates is None:
+            if not os.path.exists(os.path.join(generator.uploads_dir, f"{product_id}.json")):
+                return jsonify({"error": "Produto não encontrado"}), 404
+            aggregates = ReviewStore.empty_aggregates()
+        
+        limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+        offset = max(0, request.args.get('offset', 0, type=int))
+        comments = generator.review_store.get_page(product_id, offset, limit)
+        return jsonify({
+            "success": True,
+            "product_id": product_id,
+            "aggregates": aggregates,
+            "total": aggregates['total'],
+            "offset": offset,
+            "limit": limit,
+            "comments": comments
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/product/<product_id>/warm-status', methods=['GET'])
+def get_product_warm_status(product_id):
+    """Status do pré-aquecimento das imagens do produto no cache do proxy"""
+    try:
+        data = generator.get_product_data(product_id)
+        if not data:
+            return jsonify({"error": "Produto não encontrado"}), 404
+        return jsonify({"success": True, "product_id": product_id, **generator.image_warmer.status(product_id, data)})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/product/<product_id>/history', methods=['GET'])
+def get_product_history(product_id):
+    """Histórico de preço/estoque com filtro de período (start/end em epoch) e agregação (interval ou points)"""
+    try:
+        data = generator.get_product_data(product_id)
+        if not data:
+            return jsonify({"error": "Produto não encontrado"}), 404
+        
+        history_key = data.get('historyKey') or generator.price_history.resolve_key(data)
+        points = request.args.get('points', type=int)
+        interval = request.args.get('interval', type=int)
+        result = generator.price_history.query(
+            history_key,
+            start=request.args.get('start', type=float),
+            end=request.args.get('end', type=float),
+            interval=interval if interval and interval > 0 else None,
+            points=points if points and points > 0 else None
+        )
+        if result is None:
+            result = {'total_points': 0, 'interval': None, 'series': {}}
+        return jsonify({"success": True, "product_id": product_id, "history_key": history_key, **result})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/products', methods=['GET'])
 def list_products():
     try:
@@ -702,9 +2602,82 @@ def list_products():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/search', methods=['GET'])
+def search_products():
+    """Busca textual com filtros de preço e avaliação"""
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({"error": "Parâmetro q é obrigatório"}), 400
+        
+        result = generator.search_index.search(
+            query,
+            prefix=request.args.get('prefix', '').lower() in ('1', 'true', 'sim'),
+            min_price=request.args.get('min_price', type=float),
+            max_price=request.args.get('max_price', type=float),
+            min_rating=request.args.get('min_rating', type=float),
+            limit=max(1, min(request.args.get('limit', 20, type=int), 100)),
+            offset=max(0, request.args.get('offset', 0, type=int))
+        )
+        return jsonify({"success": True, "query": query, **result})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/upload-multipart', methods=['POST'])
+@admission_control('upload')
+def upload_multipart():
+    """Upload multipart/form-data: JSON do produto no campo 'product' e imagens binárias em 'images'"""
+    try:
+        if request.mimetype != 'multipart/form-data':
+            return jsonify({"error": "Envie multipart/form-data"}), 400
+        
+        # Limites aplicados pelo parser do Werkzeug enquanto lê o corpo
+        request.max_content_length = MAX_UPLOAD_BODY_SIZE
+        request.max_form_memory_size = MAX_UPLOAD_FORM_FIELD_SIZE
+        
+        logger.info("🎯 Recebendo upload multipart...")
+        
+        # JSON do produto pode vir como campo de texto ou como arquivo
+        product_part = request.files.get('product')
+        raw_json = product_part.read() if product_part else request.form.get('product')
+        if not raw_json:
+            return jsonify({"error": "Campo 'product' com o JSON do produto é obrigatório"}), 400
+        try:
+            json_data = json.loads(raw_json)
+        except ValueError as e:
+            return jsonify({"error": f"JSON inválido no campo 'product': {e}"}), 400
+        
+        # Tipo e tamanho de cada imagem são validados ao gravá-la (UploadRejected → 400/413)
+        images = request.files.getlist('images')
+        
+        # Processar dados
+        result = generator.process_json_upload(json_data, images)
+        
+        if result.get('success'):
+            return jsonify(result)
+        else:
+            return jsonify(result), 400
+    
+    except RequestEntityTooLarge:
+        return jsonify({"error": f"Corpo excede o limite de {MAX_UPLOAD_BODY_SIZE} bytes"}), 413
+    
+    except UploadRejected as e:
+        return jsonify({"error": str(e)}), e.status_code
+    
+    except Exception as e:
+        logger.error(f"❌ Erro no upload multipart: {e}")
+        return jsonify({"error": str(e)}), 500
+
+def _cached_image_response(path: str, content_type: str):
+    response = send_file(os.path.abspath(path), mimetype=content_type, max_age=3600)  # Cache por 1 hora
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    response.headers['Access-Control-Allow-Methods'] = 'GET'
+    return response
+
 # 🖼️ PROXY DE IMAGENS - Contornar CORS da Shopee
 @app.route('/api/image-proxy', methods=['GET'])
 @app.route('/proxy-image', methods=['GET'])  # Rota adicional para compatibilidade
+@admission_control('proxy')
 def image_proxy():
     """Proxy para servir imagens da Shopee contornando CORS"""
     try:
@@ -714,27 +2687,31 @@ def image_proxy():
             return jsonify({"error": "URL da imagem não fornecida"}), 400
         
         # Verificar se é uma URL da Shopee válida
-        if 'susercontent.com' not in image_url and 'shopee.com' not in image_url:
+        if not is_allowed_image_url(image_url):
             return jsonify({"error": "URL não permitida"}), 403
         
-        print(f"🖼️ Proxy de imagem: {image_url[:50]}...")
+        # Largura de miniatura opcional (?w=300)
+        width = request.args.get('w', type=int)
+        if width is not None and width not in THUMBNAIL_WIDTHS:
+            return jsonify({"error": f"Largura inválida, use uma de {list(THUMBNAIL_WIDTHS)}"}), 400
         
-        # Headers para simular navegador real
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
-            'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Referer': 'https://shopee.com.br/',
-            'Sec-Fetch-Dest': 'image',
-            'Sec-Fetch-Mode': 'no-cors',
-            'Sec-Fetch-Site': 'cross-site'
-        }
+        # Servir do cache quando disponível (aquecido no upload ou em visita anterior)
+        cached = (generator.image_cache.thumbnail(image_url, width) if width else None) or generator.image_cache.get(image_url)
+        if cached:
+            return _cached_image_response(*cached)
+        
+        print(f"🖼️ Proxy de imagem: {image_url[:50]}...")
         
         # Fazer request da imagem
-        response = requests.get(image_url, headers=headers, timeout=10)
+        response = fetch_upstream(image_url, headers=IMAGE_PROXY_HEADERS)
         
         if response.status_code == 200:
+            generator.image_cache.put(image_url, response.content)
+            if width:
+                cached = generator.image_cache.thumbnail(image_url, width)
+                if cached:
+                    return _cached_image_response(*cached)
+            
             # Determinar tipo de conteúdo
             content_type = response.headers.get('content-type', 'image/jpeg')
             
@@ -752,6 +2729,10 @@ def image_proxy():
             print(f"❌ Erro ao buscar imagem: HTTP {response.status_code}")
             return jsonify({"error": f"Erro ao buscar imagem: HTTP {response.status_code}"}), response.status_code
             
+    except UpstreamUnavailable as e:
+        headers = {'Retry-After': str(int(e.retry_after) + 1)} if e.retry_after else {}
+        return jsonify({"error": str(e)}), e.status_code, headers
+        
     except requests.exceptions.Timeout:
         print("⏰ Timeout ao buscar imagem")
         return jsonify({"error": "Timeout ao buscar imagem"}), 408
@@ -844,8 +2825,13 @@ if __name__ == '__main__':
     print("📡 Servidor: http://localhost:5007")
     print("🔗 Endpoints:")
     print("   POST /api/upload-json - Upload de dados")
+    print("   POST /api/upload-multipart - Upload de dados + imagens (multipart)")
     print("   GET /api/product/<id> - Obter produto")
+    print("   GET /api/product/<id>/comments - Comentários paginados")
+    print("   GET /api/product/<id>/warm-status - Status do cache de imagens")
+    print("   GET /api/product/<id>/history - Histórico de preço e estoque")
     print("   GET /api/products - Listar produtos")
+    print("   GET /api/search?q=<termos> - Buscar produtos")
     print("   GET /api/image-proxy?url=<url> - Proxy de imagens")
     print("   POST /api/landing-page/<id> - Salvar landing page")
     print("   GET /landing/<id> - Visualizar landing page completa")
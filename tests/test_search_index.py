@@ -0,0 +1,102 @@
+import importlib
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+COMMON = ['fone', 'bluetooth', 'fio', 'capa', 'celular', 'carregador', 'usb', 'preto', 'branco', 'kit', 'cabo', 'bateria']
+WEIGHTS = [1.0 / (rank + 1) ** 0.7 for rank in range(len(COMMON))]
+
+QUERIES = [
+    ('fone', {}),
+    ('fone bluetooth', {}),
+    ('cabo usb preto', {}),
+    ('fone', {'offset': 15, 'limit': 10}),
+    ('fone bluetooth', {'min_price': 100}),
+    ('celular', {'min_rating': 4, 'limit': 5}),
+    ('ba*', {}),
+    ('fone c*', {'limit': 7}),
+]
+
+
+@pytest.fixture(scope='module')
+def jlg(tmp_path_factory):
+    # O módulo cria as pastas de dados no diretório atual ao ser importado
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('data'))
+    try:
+        yield importlib.import_module('json_landing_generator')
+    finally:
+        os.chdir(cwd)
+
+
+def make_product(rng):
+    return {
+        'name': ' '.join(rng.choices(COMMON, WEIGHTS, k=rng.randint(1, 5))),
+        'description': ' '.join(rng.choices(COMMON, WEIGHTS, k=rng.randint(0, 12))),
+        'price': 'R$ %d,90' % rng.randint(10, 300),
+        'rating': rng.randint(1, 5)
+    }
+
+
+def build_index(jlg, tmp_path, count=1500):
+    rng = random.Random(7)
+    index = jlg.ProductSearchIndex(str(tmp_path / 'search.jsonl'))
+    for i in range(count):
+        index.add_product('p%05d' % i, make_product(rng))
+    return index, rng
+
+
+def search_both(index, query, kwargs):
+    index.EXHAUSTIVE_SCORING_LIMIT = float('inf')
+    exhaustive = index.search(query, **kwargs)
+    # Força a ordem de impacto sem tetos: a parada antecipada tem de dar o mesmo topo
+    index.EXHAUSTIVE_SCORING_LIMIT = 0
+    index.MAX_POSTINGS_PER_CANDIDATE = float('inf')
+    index.MAX_SCORED_CANDIDATES = index.MAX_IMPACT_READS = 10 ** 9
+    early = index.search(query, **kwargs)
+    return exhaustive, early
+
+
+@pytest.mark.parametrize('query,kwargs', QUERIES)
+def test_early_termination_matches_exhaustive(jlg, tmp_path, query, kwargs):
+    index, _ = build_index(jlg, tmp_path)
+    exhaustive, early = search_both(index, query, kwargs)
+    assert early == exhaustive
+    assert exhaustive['results']
+
+
+def test_impact_order_follows_updates(jlg, tmp_path):
+    index, rng = build_index(jlg, tmp_path)
+    for query, kwargs in QUERIES:
+        search_both(index, query, kwargs)
+    assert index._impacts
+
+    for i in range(0, 1500, 7):
+        index.add_product('p%05d' % i, make_product(rng))
+    for i in range(3, 1500, 11):
+        index.remove_product('p%05d' % i)
+    for i in range(1500, 1700):
+        index.add_product('p%05d' % i, make_product(rng))
+
+    for query, kwargs in QUERIES:
+        exhaustive, early = search_both(index, query, kwargs)
+        assert early == exhaustive
+    for term, impacts in index._impacts.items():
+        entries = sorted(product_id for bucket in impacts.values() for _, product_id in bucket)
+        assert entries == sorted(index._postings[term])
+
+
+def test_capped_ranking_is_flagged(jlg, tmp_path):
+    index, _ = build_index(jlg, tmp_path)
+    index.EXHAUSTIVE_SCORING_LIMIT = 0
+    index.MAX_POSTINGS_PER_CANDIDATE = float('inf')
+    index.MAX_SCORED_CANDIDATES = 20
+    index.MAX_IMPACT_READS = 50
+    result = index.search('fone bluetooth', limit=10)
+    assert result['truncated']
+    assert len(result['results']) == 10
+    assert result['total'] == len(set(index._postings['fone']) & set(index._postings['bluetooth']))
@@ -0,0 +1,97 @@
+import base64
+import importlib
+import io
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CHUNK_SIZES = [1, 2, 3, 5, 7, 64, 65536]
+
+VALID_DOCUMENTS = [
+    '{"name":"Fone Bluetooth","price":129.9,"rating":4.5,"stock":0,"tags":[],"extra":{}}',
+    '{"name":"a\\ud83dA"}',
+    '{"name":"a\\ud83d\\u0041"}',
+    '{"name":"\\ud83d\\ude00 emoji por escape"}',
+    '{"name":"\\udc00 baixo isolado","b":"\\ud83d"}',
+    '{"name":"\\ud83d\\ud83d\\ude00"}',
+    '{"name":"acentuação çãõ 😀 direto em UTF-8"}',
+    '{"name":"escapes \\" \\\\ \\/ \\b \\f \\n \\r \\t \\u00e9"}',
+    '{"name":"x","nums":[-1,0,1e3,2.5E-2,-0.0],"flags":[true,false,null]}',
+    ' \n {"name" : "espaços" , "list" : [ 1 , "dois" , { "tres" : 3 } ] } \n ',
+    '{"name":"x","comments":[{"user":"u","images":["data:image/jpeg;base64,/9j/AAAA"]}]}',
+    '{"name":"x","variations":[{"image":"data:image/png;base64,iVBORw0KGgo="}]}',
+]
+
+INVALID_DOCUMENTS = [
+    '{"name":"a\\uZZZZ"}',
+    '{"name":"a\\u12"}',
+    '{"name":"a\\u+123"}',
+    '{"name":"a\\u1_23"}',
+    '{"name":"\\ud83d\\uZZZZ"}',
+    '{"name":"a\\q"}',
+    '{"name":"sem fim}',
+    '{"name":"x",}',
+    '{"name":"x"} extra',
+]
+
+
+@pytest.fixture(scope='module')
+def jlg(tmp_path_factory):
+    # O módulo cria as pastas de dados no diretório atual ao ser importado
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('data'))
+    try:
+        yield importlib.import_module('json_landing_generator')
+    finally:
+        os.chdir(cwd)
+
+
+def parse(jlg, text, chunk_size, images_dir):
+    ingestor = jlg.StreamingJSONIngestor(io.BytesIO(text.encode('utf-8')), str(images_dir), chunk_size=chunk_size)
+    try:
+        return ingestor.parse()
+    finally:
+        ingestor.cleanup()
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+@pytest.mark.parametrize('document', VALID_DOCUMENTS)
+def test_matches_json_loads(jlg, tmp_path, document, chunk_size):
+    assert parse(jlg, document, chunk_size, tmp_path) == json.loads(document)
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+@pytest.mark.parametrize('document', INVALID_DOCUMENTS)
+def test_rejects_malformed_json(jlg, tmp_path, document, chunk_size):
+    with pytest.raises(ValueError):
+        json.loads(document)
+    with pytest.raises(jlg.UploadRejected) as excinfo:
+        parse(jlg, document, chunk_size, tmp_path)
+    assert excinfo.value.status_code == 400
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 65536])
+def test_product_images_are_streamed_to_disk(jlg, tmp_path, chunk_size):
+    content = b'\xff\xd8\xff' + bytes(range(256)) * 20
+    encoded = base64.b64encode(content).decode()
+    document = json.dumps({
+        'name': 'x',
+        'images': ['data:image/jpeg;base64,' + encoded, {'base64': encoded}, 'data:image/png;base64,@@@@'],
+        'comments': [{'images': ['data:image/jpeg;base64,' + encoded]}]
+    })
+    ingestor = jlg.StreamingJSONIngestor(io.BytesIO(document.encode()), str(tmp_path), chunk_size=chunk_size)
+    value = ingestor.parse()
+
+    streamed, nested, invalid = value['images'][0], value['images'][1]['base64'], value['images'][2]
+    for image in (streamed, nested):
+        assert isinstance(image, jlg.StreamedImage) and image.error is None
+        with open(image.local_path, 'rb') as f:
+            assert f.read() == content
+    assert isinstance(invalid, jlg.StreamedImage) and invalid.error
+    # Fora dos caminhos de imagem do produto a string é mantida inteira
+    assert value['comments'][0]['images'][0] == 'data:image/jpeg;base64,' + encoded
+    ingestor.cleanup()